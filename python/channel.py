@@ -185,7 +185,7 @@ class Channel:
             return
 
         if len(self.sampleList[index].weights) == 0:
-            self.sampleList[index].weights = deepcopy(self.weights)
+            self.sampleList[index].setWeights(self.weights)
 
         for (systName, syst) in list(self.systDict.items()):
             if not systName in list(self.sampleList[index].systDict.keys()):
@@ -323,10 +323,7 @@ class Channel:
 
         for syst in list(self.systDict.values()):
             if syst.type == "weight":
-                if not weight in syst.high:
-                    syst.high.append(weight)
-                if not weight in syst.low:
-                    syst.low.append(weight)
+                syst.addWeight(weight)
         return
 
     def removeWeight(self, weight):
@@ -345,10 +342,7 @@ class Channel:
 
         for syst in list(self.systDict.values()):
             if syst.type == "weight":
-                if weight in syst.high:
-                    syst.high.remove(weight)
-                if weight in syst.low:
-                    syst.low.remove(weight)
+                syst.removeWeight(weight)
         return
 
     def addDiscoverySamples(self, srList, startValList, minValList,
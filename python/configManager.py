@@ -118,10 +118,12 @@ class ConfigManager:
         self.blindVR = False # Blind the VRs only
         self.useSignalInBlindedData = False # Add signal MC on top when building blinded data histogram in SR
         self.keepSignalRegionType = False # Force SR to always remain an SR and no autochanging to VR
+        self.keepDebugHistograms = False # Keep copies of HistoSys variations before their transfer onto the nominal (always kept at DEBUG log level)
         self.FitType = enum('FitType','Discovery , Exclusion , Background') # to distinguish between background, exclusion and discovery fit
         self.myFitType = None #propagted from HistFitter.py
         self.scanRange = None # possibility to define a scan range with a tuple (min, max) (when the first fit fails)
         self.normList = [] # List of normalization factors
+        self._normSet = set() # Names in normList, for fast membership tests
         self.outputFileName = None # Output file name used to store fit results
         self.stackList = [] # List of stacks for plotting
         self.canvasList = [] # List of canvases for plotting
@@ -1353,7 +1355,7 @@ class ConfigManager:
             pass
         elif syst.method == "shapeSys":
             if syst.merged:
-                mergedName = "".join(syst.sampleList)
+                mergedName = syst.mergedName
                 
                 nomMergedName = f"h{mergedName}Nom_{regionString}_obs_{replaceSymbols(chan.variableName)}"
                 highMergedName = f"h{mergedName}High_{regionString}_obs_{replaceSymbols(chan.variableName)}"
@@ -607,10 +607,7 @@ class fitConfig:
         # already have this weight
         for syst in list(self.systDict.values()):
             if syst.type == "weight":
-                if not weight in syst.high:
-                    syst.high.append(weight)
-                if not weight in syst.low:
-                    syst.low.append(weight)
+                syst.addWeight(weight)
         return
 
     def removeWeight(self, weight):
@@ -638,10 +635,7 @@ class fitConfig:
         # Propagate to owned weight-type systematics
         for syst in list(self.systDict.values()):
             if syst.type == "weight":
-                if weight in syst.high:
-                    syst.high.remove(weight)
-                if weight in syst.low:
-                    syst.low.remove(weight)
+                syst.removeWeight(weight)
         return
 
     def setSignalSample(self, sig):
@@ -112,6 +112,12 @@ class Logger:
         if(lock):
             self.always("This log level is the final setting") 
 
+    def isDebug(self):
+        """
+        Return whether messages at the debug level are written out
+        """
+        return self._log.GetMinLevel() <= DEBUG
+
     def verbose(self, msg):
         """
         Write out a message at the verbose level
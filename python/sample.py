@@ -18,9 +18,11 @@
 """
 
 import ROOT
-from ROOT import TFile, TMath, RooRandom, TH1, TH1F
+from ROOT import TFile, TMath, RooRandom, TH1, TH1F, TNamed
 from ROOT import kBlack, kWhite, kGray, kRed, kPink, kMagenta, kViolet, kBlue, kAzure, kCyan, kTeal, kGreen, kSpring, kYellow, kOrange, kDashed, kSolid, kDotted
 from math import fabs
+import numpy as np
+from scipy.stats import chi2 as _scipy_chi2
 from logger import Logger
 from systematic import SystematicBase
 from inputTree import InputTree
@@ -29,49 +31,198 @@ log = Logger('Sample')
 
 TH1.SetDefaultSumw2(True)
 
-from copy import deepcopy
-from configManager import configMgr, replaceSymbols
+from copy import copy, deepcopy
+from collections import namedtuple
+from io import StringIO
+from sys import intern
+from operator import itemgetter
+from xml.sax.saxutils import escape
+from configManager import configMgr
+
+## Histogram variations generated for every systematic, in naming order
+_HIST_VARIATIONS = ("Nom", "High", "Low")
+## Accepted variation spellings mapped onto the names used in histograms
+_VAR_CANON = {"": "Nom", "Nom": "Nom",
+              "High": "High", "Up": "High",
+              "Low": "Low", "Down": "Low"}
+
+## Entry of Sample.histoSystList; only the name, the high and low histograms and their file are filled,
+## the trailing fields are kept empty for the positional layout readers rely on
+_HistoSysEntry = namedtuple("_HistoSysEntry", ("name", "highName", "lowName", "histFile", "unused1", "unused2", "unused3", "unused4"),
+                             defaults=("", "", "", ""))
+
+## XML templates of Sample.__str__
+_SAMPLE_FMT = "  <Sample Name=\"%s\" HistoName=\"%s\" InputFile=\"%s\" NormalizeByTheory=\"%s\">\n"
+_STATERR_FMT = "    <StatError Activate=\"%s\"/>\n"
+_HISTOSYS_FMT = "    <HistoSys Name=\"%s\" HistoNameHigh=\"%s\" HistoNameLow=\"%s\" />\n"
+_SHAPESYS_FMT = "    <ShapeSys Name=\"%s\" HistoName=\"%s\" ConstraintType=\"%s\"/>\n"
+_OVERALLSYS_FMT = "    <OverallSys Name=\"%s\" High=\"%g\" Low=\"%g\" />\n"
+_SHAPEFACT_FMT = "    <ShapeFactor Name=\"%s\" />\n"
+_NORMFACT_FMT = "    <NormFactor Name=\"%s\" Val=\"%g\" High=\"%g\" Low=\"%g\" Const=\"%s\" />\n"
+_SAMPLE_END = "  </Sample>\n\n"
+
+def _xmlAttr(value):
+    """
+    Escape a string for use in a double-quoted XML attribute
 
-def chi2test(h1, h2):
-    if h2.Integral() == 0:
-        return 1
-    norm = h1.Integral() / h2.Integral()
+    @param value The string to escape
+    """
+    return escape(value, {"\"": "&quot;"})
 
-    from scipy.stats import chi2
+## Leading fields of the entries in the systematic and normFactor lists
+_get012 = itemgetter(0, 1, 2)
+_get01234 = itemgetter(0, 1, 2, 3, 4)
 
-    binsX = range(1, h1.GetNbinsX()+1)
-    binsY = range(1, h1.GetNbinsY()+1) if h1.InheritsFrom("TH2") else [0]
-    
-    test_chi2, dof = 0, 0
-    for i in binsX:
-        for j in binsY:
-            idx = h1.GetBin(i, j)
+def _findEntry(entries, index, name):
+    """
+    Return the position of the first entry of a systematic in a list of entries, or None
+
+    The index of positions by name is only trusted where the entry at the position still carries the
+    name; on a miss the list may have been changed from outside, and the index is built again from all entries.
+
+    @param entries The list of entries, with the systematic name as first field
+    @param index Dictionary of positions by name, updated in place
+    @param name Name of the systematic
+    """
+    idx = index.get(name)
+    if idx is not None and idx < len(entries) and entries[idx][0] == name:
+        return idx
+
+    index.clear()
+    for (i, entry) in enumerate(entries):
+        index.setdefault(entry[0], i)
+    return index.get(name)
+
+def _hasBinBuffer(hist):
+    """
+    Return True if the bin contents of a histogram can be viewed as a NumPy array, i.e. it is backed by a TArrayF or TArrayD
+
+    @param hist The histogram to check
+    """
+    return hist.InheritsFrom("TArrayD") or hist.InheritsFrom("TArrayF")
+
+def _binContents(hist):
+    """
+    Return a writable NumPy view on the bin contents of a histogram, including under- and overflow
+
+    @param hist The histogram to view; must be backed by a TArrayF or TArrayD, see _cellContents() for others
+    """
+    if hist.InheritsFrom("TArrayD"):
+        dtype = np.float64
+    elif hist.InheritsFrom("TArrayF"):
+        dtype = np.float32
+    else:
+        raise TypeError(f"Cannot view bin contents of {hist.GetName()}: unsupported storage type {hist.ClassName()}")
+
+    return np.frombuffer(hist.GetArray(), dtype=dtype, count=hist.GetNcells())
+
+def _binErrorsSquared(hist):
+    """
+    Return the squared bin errors of a histogram, including under- and overflow
+
+    @param hist The histogram to read the errors from
+    """
+    if hist.GetSumw2N() == 0:
+        # without Sumw2, ROOT uses Poisson errors on the bin content
+        return np.abs(_cellContents(hist))
+
+    # the sum of squared weights is a TArrayD for every storage type
+    return np.frombuffer(hist.GetSumw2().GetArray(), dtype=np.float64, count=hist.GetNcells())
+
+def _cellContents(hist):
+    """
+    Return the bin contents of a histogram as a float64 array, including under- and overflow
+
+    @param hist The histogram to read; storage without a NumPy view (e.g. TH1I) is read bin by bin
+    """
+    if _hasBinBuffer(hist):
+        return _binContents(hist).astype(np.float64)
+
+    nCells = hist.GetNcells()
+    return np.fromiter((hist.GetBinContent(i) for i in range(nCells)), dtype=np.float64, count=nCells)
+
+def _setCellContents(hist, values, first=0):
+    """
+    Overwrite the contents of consecutive cells of a histogram
+
+    @param hist The histogram to modify in place; storage without a NumPy view (e.g. TH1I) is written bin by bin
+    @param values The new contents
+    @param first The cell that takes the first value (default 0, the underflow)
+    """
+    if _hasBinBuffer(hist):
+        _binContents(hist)[first:first+len(values)] = values
+        return
+
+    for (iCell, value) in enumerate(values, first):
+        hist.SetBinContent(iCell, value)
+
+def _innerBins(hist, values):
+    """
+    Strip the under- and overflow bins from a per-cell array of a histogram
+
+    @param hist The histogram the values belong to
+    @param values Array with one entry per cell of the histogram
+    """
+    if hist.InheritsFrom("TH2"):
+        return values.reshape(hist.GetNbinsY()+2, hist.GetNbinsX()+2)[1:-1, 1:-1]
+
+    return values[1:-1]
+
+def _cellValues(hist):
+    """
+    Return the bin contents and squared errors of a histogram as float64 arrays, including under- and overflow
 
-            if(h1.GetBinContent(idx) * h1.GetBinContent(idx) == 0 and h2.GetBinContent(idx) * h2.GetBinContent(idx)):
-                continue
+    @param hist The histogram to read; storage without a NumPy view (e.g. TH1I) is read bin by bin
+    """
+    return (_cellContents(hist), _binErrorsSquared(hist))
 
-            sigma = max([h1.GetBinError(idx), h2.GetBinError(idx)*norm])
-            if sigma == 0: continue
-            test_chi2 += ((h1.GetBinContent(idx) - h2.GetBinContent(idx)*norm) / sigma)**2
-            dof += 1
+def _chi2Kernel(c1, c2, err1, err2, norm):
+    """
+    Sum the chi2 of two binned distributions, the second one scaled by norm
+
+    @param c1 Bin contents of the first distribution
+    @param c2 Bin contents of the second distribution
+    @param err1 Bin errors of the first distribution
+    @param err2 Bin errors of the second distribution
+    @param norm Ratio of the integrals of the first and second distribution
+    @returns Tuple of the chi2 and the number of bins that entered it
+    """
+    # skip bins that are empty in h1 only, and bins without any error
+    sigma = np.maximum(err1, err2*norm)
+    mask = ~((c1 == 0) & (c2 != 0)) & (sigma != 0)
 
+    test_chi2 = (((c1[mask] - c2[mask]*norm) / sigma[mask])**2).sum()
+    return (test_chi2, int(mask.sum()))
 
-    #print "dof = {}".format(dof)
-    #print "test_chi2 = {}".format(test_chi2)
+def chi2test(h1, h2):
+    if h2.Integral() == 0:
+        return 1
+    norm = h1.Integral() / h2.Integral()
+
+    (c1, e1sq) = _cellValues(h1)
+    (c2, e2sq) = _cellValues(h2)
 
-    #print ROOT.TMath.Prob(test_chi2, dof)
+    (test_chi2, dof) = _chi2Kernel(_innerBins(h1, c1), _innerBins(h2, c2),
+                                   np.sqrt(_innerBins(h1, e1sq)), np.sqrt(_innerBins(h2, e2sq)), norm)
 
-    return chi2.sf(test_chi2, dof)
+    return _scipy_chi2.sf(test_chi2, dof)
 
-def checkNormalizationEffect(hNom, hUp, hDown, norm_threshold=0.005):
+def checkNormalizationEffect(hNom, hUp, hDown, norm_threshold=0.005, nom_integral=None, up_integral=None, down_integral=None):
     # True for keeping norm effect, false for pruning
-    nom_integral = hNom.Integral()
+    # Integrals the caller already has can be passed in to avoid summing the histograms again
+    if nom_integral is None:
+        nom_integral = hNom.Integral()
     
     if nom_integral == 0:
         return True
     
-    up_norm = hUp.Integral() / nom_integral
-    down_norm = hDown.Integral() / nom_integral
+    if up_integral is None:
+        up_integral = hUp.Integral()
+    if down_integral is None:
+        down_integral = hDown.Integral()
+
+    up_norm = up_integral / nom_integral
+    down_norm = down_integral / nom_integral
    
     max_variation = max([abs(up_norm-1), abs(down_norm-1)])
     if max_variation < norm_threshold:
@@ -80,78 +231,391 @@ def checkNormalizationEffect(hNom, hUp, hDown, norm_threshold=0.005):
 
     return True
     
+def _comparisonArrays(hist, use_overflows=True):
+    """
+    Return the bin contents and squared errors of a histogram as float64 arrays for a shape comparison
+
+    @param hist The histogram to read
+    @param use_overflows Include the under- and overflow bins
+    """
+    (contents, errors2) = _cellValues(hist)
+    if not use_overflows:
+        return (_innerBins(hist, contents), _innerBins(hist, errors2))
+
+    return (contents, errors2)
+
+def _chi2TestWW(c1, e1sq, c2, e2sq):
+    """
+    Weighted-weighted chi2 comparison of two binned distributions, as done by TH1::Chi2Test with option "WW"
+
+    @param c1 Bin contents of the first distribution
+    @param e1sq Squared bin errors of the first distribution
+    @param c2 Bin contents of the second distribution
+    @param e2sq Squared bin errors of the second distribution
+    @returns The p-value of the comparison
+    """
+    if c1.size != c2.size:
+        raise ValueError(f"Cannot compare distributions with a different number of bins: {c1.size} and {c2.size}")
+
+    sum1 = c1.sum()
+    sum2 = c2.sum()
+    if sum1 == 0 or sum2 == 0:
+        # ROOT refuses to compare an empty histogram and returns 0
+        return 0.
+
+    # like ROOT, bins that are empty in both histograms are skipped and cost one degree of freedom
+    used = (c1 != 0) | (c2 != 0)
+    ndf = int(used.sum()) - 1
+    if ndf < 1:
+        # TMath::Prob() is 0 without degrees of freedom
+        return 0.
+
+    if ((e1sq[used] == 0) & (e2sq[used] == 0)).any():
+        # a filled bin without an error in either histogram makes ROOT give up and return 0
+        return 0.
+
+    delta = sum2*c1[used] - sum1*c2[used]
+    sigma = sum1*sum1*e2sq[used] + sum2*sum2*e1sq[used]
+
+    return _scipy_chi2.sf((delta*delta / sigma).sum(), ndf)
+
 def checkShapeEffect(hNom, hUp, hDown, chi2_threshold=0.05, use_overflows=True):
-  
+
     #method 1: perform a comparison based on a chi2 test
     if configMgr.prunMethod==1:
         # Perform a weighted comparison including the overflow and underflow, unless the user says they don't want it
-        opt = "WW OF UF"
-        if not use_overflows:
-            opt = "WW"
+        (nom, nomErr2) = _comparisonArrays(hNom, use_overflows)
 
-        # ROOT prints annoying messages about bin content at Info level; suppress them temporarily
-        _err_level = ROOT.gErrorIgnoreLevel
-        ROOT.gErrorIgnoreLevel = 2000
+        # the systematic is kept if either variation is incompatible with the nominal; if up is compatible,
+        # the maximum p-value is already above threshold and the down variation doesn't matter
+        up_pvalue = _chi2TestWW(nom, nomErr2, *_comparisonArrays(hUp, use_overflows))
+        if not up_pvalue < chi2_threshold:
+            log.info(f"checkShapeEffect(): {hNom.GetName()}, {hUp.GetName()}, {hDown.GetName()}: up_pvalue = {up_pvalue:.3f}, chi2 threshold = {chi2_threshold:.3f}")
+            return False
 
-        up_pvalue = hNom.Chi2Test(hUp, opt)
-        down_pvalue = hNom.Chi2Test(hDown, opt)
-    
-        ROOT.gErrorIgnoreLevel = _err_level
-    
-        #up_pvalue = chi2test(hNom, hUp)
-        #down_pvalue = chi2test(hNom, hDown)
-    
-        pvalue = max([up_pvalue, down_pvalue])
-        if not pvalue < chi2_threshold:
-            log.info(f"checkShapeEffect(): {hNom.GetName()}, {hUp.GetName()}, {hDown.GetName()}: up_pvalue = {up_pvalue:.3f}, down_pvalue = {down_pvalue:3f}, chi2 threshold = {chi2_threshold:.3f}")
+        down_pvalue = _chi2TestWW(nom, nomErr2, *_comparisonArrays(hDown, use_overflows))
+        if not down_pvalue < chi2_threshold:
+            log.info(f"checkShapeEffect(): {hNom.GetName()}, {hUp.GetName()}, {hDown.GetName()}: up_pvalue = {up_pvalue:.3f}, down_pvalue = {down_pvalue:.3f}, chi2 threshold = {chi2_threshold:.3f}")
             return False
     
     #method 2: compare yield of all bins and check if below the configMgr.prunThreshold
     elif configMgr.prunMethod==2:
-        if (not hNom.GetNbinsX() is hUp.GetNbinsX()) or (not hNom.GetNbinsX() is hDown.GetNbinsX()):
+        nBins = hNom.GetNbinsX()
+        if hUp.GetNbinsX() != nBins or hDown.GetNbinsX() != nBins:
             log.error(f"Checking shape impact of nominal histogram {hNom.GetName()} againt up histogram {hUp.GetName()} and down histogram {hDown.GetName()} and find a different number of bins. Stop comparison")
             return True
-        for bin1 in range(0,hNom.GetNbinsX()+2):
-            if (bin1==0 or bin1==hNom.GetNbinsX()+1) and use_overflows==False:
-                continue
-            if fabs(hNom.GetBinContent(bin1)-hUp.GetBinContent(bin1))>(configMgr.prunThreshold*hNom.GetBinContent(bin1)) or fabs(hNom.GetBinContent(bin1)-hDown.GetBinContent(bin1))>(configMgr.prunThreshold*hNom.GetBinContent(bin1)):
-                log.debug(f"checkShapeEffect(): (up - nominal): {hUp.GetBinContent(bin1)-hNom.GetBinContent(bin1):f}, (nominal - down): {hNom.GetBinContent(bin1)-hDown.GetBinContent(bin1):f}, for histograms {hUp.GetName():s},{hDown.GetName():s},{hNom.GetName():s}. Above prun threshold: {configMgr.prunThreshold*hNom.GetBinContent(bin1):f}")
+
+        threshold = configMgr.prunThreshold
+        if use_overflows==False:
+            binRange = range(1, nBins+1)
+        else:
+            binRange = range(0, nBins+2)
+
+        for bin1 in binRange:
+            nom = hNom.GetBinContent(bin1)
+            up = hUp.GetBinContent(bin1)
+            down = hDown.GetBinContent(bin1)
+            if fabs(nom-up)>(threshold*nom) or fabs(nom-down)>(threshold*nom):
+                log.debug(f"checkShapeEffect(): (up - nominal): {up-nom:f}, (nominal - down): {nom-down:f}, for histograms {hUp.GetName():s},{hDown.GetName():s},{hNom.GetName():s}. Above prun threshold: {threshold*nom:f}")
                 return True
-            log.debug(f"checkShapeEffect(): (up - nominal): {hUp.GetBinContent(bin1)-hNom.GetBinContent(bin1):f}, (nominal - down): {hNom.GetBinContent(bin1)-hDown.GetBinContent(bin1):f}, for histograms {hUp.GetName():s},{hDown.GetName():s},{hNom.GetName():s}. Below prun threshold: {configMgr.prunThreshold*hNom.GetBinContent(bin1):f}")
+            log.debug(f"checkShapeEffect(): (up - nominal): {up-nom:f}, (nominal - down): {nom-down:f}, for histograms {hUp.GetName():s},{hDown.GetName():s},{hNom.GetName():s}. Below prun threshold: {threshold*nom:f}")
         return False
 
     return True
 
+def _transferToNominal(hist, hNomSys, hNom):
+    """
+    Replace hist by hist / hNomSys * hNom in a single pass over the bins, propagating the
+    errors as TH1::Divide followed by TH1::Multiply would. Bins where hNomSys is empty are
+    set to 0, like TH1::Divide does.
+
+    @param hist The histogram to modify in place
+    @param hNomSys The nominal histogram of the systematic's own trees
+    @param hNom The nominal histogram
+    @returns False if the histograms have a different number of bins
+    """
+    nCells = hist.GetNcells()
+    if hNomSys.GetNcells() != nCells or hNom.GetNcells() != nCells:
+        return False
+
+    if not _hasBinBuffer(hist):
+        # integer storage truncates the contents after each step, so keep both steps
+        return bool(hist.Divide(hNomSys) and hist.Multiply(hNom))
+
+    if hist.GetSumw2N() == 0:
+        hist.Sumw2()
+
+    errors2 = _binErrorsSquared(hist)
+    c = _cellContents(hist)
+    d = _cellContents(hNomSys)
+    d2 = _binErrorsSquared(hNomSys)
+    m = _cellContents(hNom)
+    m2 = _binErrorsSquared(hNom)
+
+    nonzero = (d != 0)
+    ratio = np.divide(c, d, out=np.zeros(nCells), where=nonzero)
+    ratioErr2 = np.divide(errors2*d*d + d2*c*c, d**4, out=np.zeros(nCells), where=nonzero)
+
+    _setCellContents(hist, ratio*m)
+    errors2[:] = ratioErr2*m*m + m2*ratio*ratio
+    hist.ResetStats()
+
+    return True
+
 def symmetrizeSystematicEnvelope(nomName, lowName, highName):
-    # Loop over all bins - and look for the biggest error
-    for iBin in range(1, configMgr.hists[lowName].GetNbinsX()+1):
-        lowVal = configMgr.hists[lowName].GetBinContent(iBin)
-        highVal = configMgr.hists[highName].GetBinContent(iBin)
-        nomVal = configMgr.hists[nomName].GetBinContent(iBin)
-        
-        lowErr = fabs(nomVal-lowVal)
-        highErr = fabs(highVal-nomVal)
+    # Work on all bins at once (no under/overflow) - and look for the biggest error
+    hNom = configMgr.hists[nomName]
+    hLow = configMgr.hists[lowName]
+    hHigh = configMgr.hists[highName]
 
-        err = max(lowErr, highErr)
+    nom = _cellContents(hNom)[1:-1]
+    low = _cellContents(hLow)[1:-1]
+    high = _cellContents(hHigh)[1:-1]
 
-        # If low' = (nominal-error) is < 0, truncate it to 0
-        newLowVal = (nomVal - err)
-        if newLowVal < 0.0:
-            log.warning(f"symmetrizeSystematicEnvelope(): low={newLowVal:f} is < 0.0 in {lowName:s} bin {iBin:d}. Setting negative bins to 0.0.")
-        newHighVal = nomVal + err
-        
-        log.debug(f"symmetrizeSystematicEnvelope(): bin {iBin:d} -> found nom={nomVal}, low={lowVal}, high={highVal} => symmetrized error to low={newLowVal} high={newHighVal}")
+    err = np.maximum(np.abs(nom-low), np.abs(high-nom))
+
+    # If low' = (nominal-error) is < 0, truncate it to 0
+    newLow = nom - err
+    negative = np.flatnonzero(newLow < 0.0)
+    if negative.size > 0:
+        log.warning(f"symmetrizeSystematicEnvelope(): low < 0.0 in {lowName:s} for {negative.size:d} bin(s) {(negative+1).tolist()}. Setting negative bins to 0.0.")
+    np.clip(newLow, 0.0, None, out=newLow)
+
+    log.debug(f"symmetrizeSystematicEnvelope(): symmetrized error of {lowName:s} / {highName:s} around {nomName:s} in {nom.size:d} bins")
+
+    _setCellContents(hHigh, nom + err, 1)
+    _setCellContents(hLow, newLow, 1)
+
+    hHigh.ResetStats()
+    hLow.ResetStats()
+
+    return
+
+def symmetrizeOneSidedSystematic(nomName, lowName, highName):
+    """
+    Build the low variation of a one-sided systematic as low = 2*nom - high in a single pass,
+    with errors propagated as TH1::Scale followed by TH1::Add would. Negative bins are set to 0.
+
+    @param nomName Name of the nominal histogram
+    @param lowName Name of the low histogram to (re)create
+    @param highName Name of the high histogram
+    """
+    hists = configMgr.hists
+    hNom = hists[nomName]
+    hHigh = hists[highName]
 
-        configMgr.hists[highName].SetBinContent(iBin, newHighVal) 
-        configMgr.hists[lowName].SetBinContent(iBin, newLowVal) 
+    hLow = hNom.Clone(lowName)
+    hists[lowName] = hLow
+
+    if hLow.GetSumw2N() == 0:
+        hLow.Sumw2()
+
+    errors2 = _binErrorsSquared(hLow)
+    errors2[:] = 4.0*errors2 + _binErrorsSquared(hHigh)
+
+    low = 2.0*_cellContents(hLow) - _cellContents(hHigh)
+
+    # only the bins themselves are truncated, not the under- and overflow
+    inner = low[1:-1]
+    np.clip(inner, 0.0, None, out=inner)
+    _setCellContents(hLow, low)
+
+    hLow.ResetStats()
 
     return
 
+def _relativeDeviation(values, nom):
+    """
+    Return |values/nom - 1| per bin, and 0 for bins where the nominal is empty
+
+    @param values Bin contents of the variation
+    @param nom Bin contents of the nominal, same length as values
+    """
+    ratio = np.divide(values, nom, out=np.ones(len(values)), where=(nom != 0))
+    return np.abs(ratio - 1.0)
+
+def _setShapeContents(hist, values):
+    """
+    Overwrite the leading cells of a histogram (starting at the underflow) and clear their errors
+
+    @param hist The histogram to modify in place
+    @param values The new contents; cells beyond len(values) are not touched
+    """
+    if hist.GetSumw2N() == 0:
+        hist.Sumw2()
+
+    _setCellContents(hist, values)
+    _binErrorsSquared(hist)[:len(values)] = 0.
+    hist.ResetStats()
+
+    return
+
+def _sanitizeOverallSys(systName, high, low):
+    """
+    Validate the high and low values of an OverallSys, symmetrizing and truncating them where needed
+
+    @param systName Name of the systematic, for the log messages
+    @param high Value at +1sigma
+    @param low Value at -1sigma
+    @returns Tuple of the (possibly corrected) high and low values, or None if the systematic has no effect
+    """
+    if high == 1.0 and low == 1.0:
+        log.warning("    addOverallSys for %s: high == 1.0 and low == 1.0. Systematic is removed from fit" % systName)
+        return None
+
+    if high == 0.0 and low == 0.0:
+        log.warning(f"    addOverallSys for {systName}: high={high:g} low={low:g}. Systematic is removed from fit.")
+        return None
+
+    if high == low:
+        low = 2.0 - high
+        log.error("    addOverallSys '%s' has invalid inputs: high == low == %.3f.\n    This would result in error=(high-low)/(high+low)=0, silently cancelled by HistFactory.\n    Please fix your user configuration.\n    For now, will recover by symmetrizing error: high=%.3f low=%.3f."%(systName,high,high,low))
+
+    if high == 1.0 and low > 0.0 and low != 1.0:
+        highOld = high
+        high = 2.0 - low
+        log.warning(f"    addOverallSys for {systName}: high={highOld:g}. Taking symmetric value from low {low:g} => {high:g}")
+
+    if low == 1.0 and high > 0.0 and high != 1.0:
+        lowOld = low
+        low = 2.0 - high
+        log.warning(f"    addOverallSys for {systName}: low={lowOld:g}. Taking symmetric value from high {low:g} => {high:g}")
+
+    if low < 0.01:
+        log.warning(f"    addOverallSys for {systName}: low={low:g} is < 0.01. Setting to low=0.01. High={high:g}.")
+        low = 0.01
+
+    if high < 0.01:
+        log.warning(f"    addOverallSys for {systName}: high={high:g} is < 0.01. Setting to high=0.01. Low={low:g}.")
+        high = 0.01
+
+    #print high, high == 1.0
+    #print low, low == 1.0
+
+    # Perform these checks again after the symmetrisation
+    if abs(high-1.0) < 1E-5 and abs(low-1.0) < 1E-5:
+        log.warning("    addOverallSys for %s: high == 1.0 and low == 1.0. Systematic is removed from fit" % systName)
+        return None
+
+    if abs(high) < 1E-5 and abs(low) < 1E-5:
+        log.warning(f"    addOverallSys for {systName}: high={high:g} low={low:g}. Systematic is removed from fit.")
+        return None
+
+    return (high, low)
+
+def _scaledClone(hist, newName, factor):
+    """
+    Clone a histogram and scale the copy in one pass over its buffers, with the errors scaled
+    as TH1::Scale does
+
+    @param hist The histogram to copy
+    @param newName Name of the copy
+    @param factor The scale factor
+    """
+    clone = hist.Clone(newName)
+    if factor == 1.0:
+        return clone
+
+    if clone.GetSumw2N() == 0:
+        clone.Sumw2()
+
+    _setCellContents(clone, _cellContents(clone)*factor)
+    errors2 = _binErrorsSquared(clone)
+    errors2 *= factor*factor
+    clone.ResetStats()
+
+    return clone
+
+class _IntegralCache:
+    """
+    Integrals of the histograms in a dictionary by name, summed at most once per histogram.
+    Cloning and scaling through the cache keeps the stored values valid; histograms that are
+    replaced or modified otherwise have to be forgotten explicitly.
+    """
+
+    def __init__(self, hists):
+        """
+        @param hists The dictionary of histograms, usually configMgr.hists
+        """
+        self._hists = hists
+        self._values = {}
+
+    def get(self, name):
+        """
+        Return the integral of a histogram
+
+        @param name Name of the histogram
+        """
+        value = self._values.get(name)
+        if value is None:
+            value = self._hists[name].Integral()
+            self._values[name] = value
+        return value
+
+    def clone(self, name, newName):
+        """
+        Clone a histogram into the dictionary under a new name
+
+        @param name Name of the histogram to clone
+        @param newName Name of the clone
+        """
+        self._hists[newName] = self._hists[name].Clone(newName)
+        if name in self._values:
+            self._values[newName] = self._values[name]
+        else:
+            self._values.pop(newName, None)
+        return self._hists[newName]
+
+    def scaledClone(self, name, newName, factor):
+        """
+        Clone a histogram into the dictionary under a new name and scale the clone
+
+        @param name Name of the histogram to clone
+        @param newName Name of the clone
+        @param factor The scale factor
+        """
+        self._hists[newName] = _scaledClone(self._hists[name], newName, factor)
+        if name in self._values:
+            self._values[newName] = self._values[name] * factor
+        else:
+            self._values.pop(newName, None)
+        return self._hists[newName]
+
+    def forget(self, *names):
+        """
+        Drop the stored integrals of histograms that were changed outside the cache
+
+        @param names Names of the histograms
+        """
+        for name in names:
+            self._values.pop(name, None)
+
 class Sample:
     """
     Defines a Sample belonging to a Channel
     """
 
+    # A Sample is created for every sample and channel combination; the attributes of the class live in
+    # slots, and __dict__ is only created for extra attributes user configurations attach to a sample
+    __slots__ = ("name", "color", "isData", "isQCD", "isDiscovery", "write",
+                 "normByTheory", "statConfig",
+                 "histoSystList", "shapeSystList", "overallSystList", "shapeFactorList", "systList",
+                 "_histoSystIndex", "_overallSystIndex",
+                 "systListOverallPruned", "systListHistoPruned",
+                 "weights", "_weightsSet", "tempWeights", "_tempWeightsSet",
+                 "systDict", "_weightSysts", "_histogramNamesCache", "currentSystematic",
+                 "normFactor", "qcdSyst", "unit", "cutsDict", "input_files", "_inputKeys",
+                 "overrideTreename", "prefixTreeName", "suffixTreeName", "friendTreeName",
+                 "additionalCuts", "xsecWeight", "xsecUp", "xsecDown",
+                 "normRegions", "normSampleRemap", "noRenormSys", "parentChannel", "allowRemapOfSyst",
+                 "mergeOverallSysSet", "toBeMerged", "_treenameSuffix", "_sampleStringKey",
+                 # only set once buildHisto() / buildStatErrors() / __str__() have been called
+                 "binValues", "binStatErrors", "histoName", "sampleString",
+                 # legend label set by user configurations
+                 "legName",
+                 # any other attribute set by user configurations
+                 "__dict__")
+
     def __init__(self, name, color=1):
         """
         Store configuration, set sample name, and if to normalize by theory
@@ -187,6 +651,9 @@ class Sample:
         self.shapeSystList = []
         ## Internal list of overall systematics
         self.overallSystList = []
+        ## Positions of the systematics in histoSystList and overallSystList by name; see _findEntry()
+        self._histoSystIndex = {}
+        self._overallSystIndex = {}
         ## Internal list of shape factors
         self.shapeFactorList = []
         ## Internal list of all systematics
@@ -197,10 +664,16 @@ class Sample:
         self.systListHistoPruned = []        
         ## Internal list of weights
         self.weights = []
+        self._weightsSet = set()
         ## Internal list of sample-specific weights
         self.tempWeights = []
+        self._tempWeightsSet = set()
         ## Internal dictionary of systematics
         self.systDict = {}
+        ## Weight-type systematics of the dictionary above, by name
+        self._weightSysts = {}
+        ## Cache of getAllHistogramNamesForSystematics(), by fit configuration name
+        self._histogramNamesCache = {}
         ## Flag for the current systematic - needs to be a key of the dict above, or None
         self.currentSystematic = None
         ## Internal list of normalisation factors
@@ -212,6 +685,8 @@ class Sample:
         self.cutsDict = {}
         ## List of input files - combinations have to be unique
         self.input_files = set()
+        ## (filename, treename) of the entries above, which is what makes an InputTree unique
+        self._inputKeys = set()
         ## Override for input tree name
         self.overrideTreename = ""
         ## Prefix of input tree
@@ -240,6 +715,13 @@ class Sample:
         # will this sample be merged with something?
         self.toBeMerged = False
 
+        ## Resolved tree name suffix, see _updateTreenameSuffix()
+        self._treenameSuffix = None
+        self._updateTreenameSuffix()
+
+        ## State sampleString was built from, see _getSampleStringKey(); None if it has to be rebuilt
+        self._sampleStringKey = None
+
 
     def buildHisto(self, binValues, region, var, binLow=0.5, binWidth=1.):
         """
@@ -262,13 +744,16 @@ class Sample:
         else:
             self.histoName = "h"+self.name+"_"+region+"_obs_"+var
 
-        configMgr.hists[self.histoName] = TH1F(self.histoName, self.histoName, len(self.binValues[(region, var)]), binLow, float(len(self.binValues[(region, var)]))*binWidth+binLow)
-        for (iBin, val) in enumerate(self.binValues[(region, var)]):
-            if val <=0:
-               log.warning(f'bin {str(iBin)} of the histogram {self.histoName} empty or negative, setting as lowest value {str(configMgr.minValue)}')
-               configMgr.hists[self.histoName].SetBinContent(iBin+1, configMgr.minValue)
-            else:
-               configMgr.hists[self.histoName].SetBinContent(iBin+1, val)
+        values = np.asarray(self.binValues[(region, var)], dtype=np.float64)
+        hist = TH1F(self.histoName, self.histoName, len(values), binLow, float(len(values))*binWidth+binLow)
+        configMgr.hists[self.histoName] = hist
+
+        empty = (values <= 0)
+        for iBin in np.flatnonzero(empty):
+            log.warning(f'bin {str(iBin)} of the histogram {self.histoName} empty or negative, setting as lowest value {str(configMgr.minValue)}')
+
+        _binContents(hist)[1:-1] = np.where(empty, configMgr.minValue, values)
+        hist.ResetStats()
 
         return
 
@@ -294,19 +779,63 @@ class Sample:
         else:
             self.histoName = "h"+self.name+"_"+region+"_obs_"+var
 
-        for (iBin, err) in enumerate(self.binStatErrors[(region, var)]):
-            try:
-                configMgr.hists[self.histoName].SetBinError(iBin+1, err)
-            except:
-                raise Exception("Errors specified without building histogram!")
+        try:
+            hist = configMgr.hists[self.histoName]
+        except KeyError:
+            raise Exception("Errors specified without building histogram!")
+
+        if hist.GetSumw2N() == 0:
+            hist.Sumw2()
+
+        errors = np.asarray(self.binStatErrors[(region, var)], dtype=np.float64)
+        _binErrorsSquared(hist)[1:len(errors)+1] = errors*errors
 
     def Clone(self):
         """
         Copy a the sample into a new instance
         """
-        newInst = deepcopy(self)
-        #for (key, val) in self.systDict.items():
-        #    newInst.systDict[key] = val
+        # Shallow copy and only duplicate the containers the new instance may mutate;
+        # a deepcopy would also walk parentChannel and the whole configuration tree
+        newInst = copy(self)
+        newInst.histoSystList = list(self.histoSystList)
+        newInst.shapeSystList = list(self.shapeSystList)
+        newInst.overallSystList = list(self.overallSystList)
+        newInst._histoSystIndex = dict(self._histoSystIndex)
+        newInst._overallSystIndex = dict(self._overallSystIndex)
+        newInst.shapeFactorList = list(self.shapeFactorList)
+        newInst.systList = list(self.systList)
+        newInst.systListOverallPruned = list(self.systListOverallPruned)
+        newInst.systListHistoPruned = list(self.systListHistoPruned)
+        newInst.weights = list(self.weights)
+        newInst._weightsSet = set(self._weightsSet)
+        newInst.tempWeights = list(self.tempWeights)
+        newInst._tempWeightsSet = set(self._tempWeightsSet)
+        newInst.normFactor = list(self.normFactor)
+        newInst.cutsDict = dict(self.cutsDict)
+        newInst.input_files = set(self.input_files)
+        newInst._inputKeys = set(self._inputKeys)
+        newInst.mergeOverallSysSet = list(self.mergeOverallSysSet)
+        if self.normRegions is not None:
+            newInst.normRegions = list(self.normRegions)
+        if hasattr(self, "binValues"):
+            newInst.binValues = dict(self.binValues)
+        if hasattr(self, "binStatErrors"):
+            newInst.binStatErrors = dict(self.binStatErrors)
+
+        # systematics carry their own weight lists that get modified per sample
+        newInst.systDict = {key: syst.Clone() for (key, syst) in self.systDict.items()}
+        newInst._weightSysts = {key: syst for (key, syst) in newInst.systDict.items() if syst.type == "weight"}
+        newInst._histogramNamesCache = {}
+
+        # currentSystematic is the nominal/high/low field of one of the systematics; point it at the clone's
+        if self.currentSystematic is not None:
+            match = next(((key, field) for (key, syst) in self.systDict.items() for field in ("nominal", "high", "low")
+                          if getattr(syst, field) is self.currentSystematic), None)
+            if match is not None:
+                newInst.currentSystematic = getattr(newInst.systDict[match[0]], match[1])
+                newInst._updateTreenameSuffix()
+
+        newInst.parentChannel = self.parentChannel
         return newInst
 
     def setUnit(self, unit):
@@ -334,6 +863,7 @@ class Sample:
         @param isData A boolean indicating whether the sample contains data or not
         """
         self.isData = isData
+        self._updateTreenameSuffix()
         return
 
     def setWeights(self, weights):
@@ -343,6 +873,7 @@ class Sample:
         @param weights List of weights to set
         """
         self.weights = deepcopy(weights)
+        self._weightsSet = set(self.weights)
         return
 
     def addSampleSpecificWeight(self, weight):
@@ -351,8 +882,9 @@ class Sample:
 
         @param weight The weight to append to the list of weights
         """
-        if not weight in self.tempWeights:
+        if not weight in self._tempWeightsSet:
             self.tempWeights.append(weight)
+            self._tempWeightsSet.add(weight)
             ## MB : propagated to actual weights in configManager, after all
             ##      systematics have been added
         else:
@@ -364,17 +896,14 @@ class Sample:
 
         @param weight The weight to append ot the various lists of weights. High/low values will be ignored if already present; if the nominal value is present, a RunTimeError is thrown.
         """
-        if not weight in self.weights:
+        if not weight in self._weightsSet:
             self.weights.append(weight)
+            self._weightsSet.add(weight)
         else:
             raise RuntimeError(f"Weight {weight} already defined in sample {self.name}")
 
-        for syst in list(self.systDict.values()):
-            if syst.type == "weight":
-                if not weight in syst.high:
-                    syst.high.append(weight)
-                if not weight in syst.low:
-                    syst.low.append(weight)
+        for syst in self._weightSysts.values():
+            syst.addWeight(weight)
         return
 
     def removeWeight(self, weight):
@@ -383,14 +912,11 @@ class Sample:
 
         @param weight The weight to remove
         """
-        if weight in self.weights:
+        if weight in self._weightsSet:
             self.weights.remove(weight)
-        for syst in list(self.systDict.values()):
-            if syst.type == "weight":
-                if weight in syst.high:
-                    syst.high.remove(weight)
-                if weight in syst.low:
-                    syst.low.remove(weight)
+            self._weightsSet.discard(weight)
+        for syst in self._weightSysts.values():
+            syst.removeWeight(weight)
         return
     
     def setQCD(self, isQCD=True, qcdSyst="uncorr"):
@@ -402,6 +928,7 @@ class Sample:
         """
         self.isQCD = isQCD
         self.qcdSyst = qcdSyst
+        self._updateTreenameSuffix()
         return
 
     def setDiscovery(self, isDiscovery=True):
@@ -411,6 +938,7 @@ class Sample:
         @param isDiscovery Boolean to set (default True)
         """
         self.isDiscovery = isDiscovery
+        self._updateTreenameSuffix()
         return
 
     def setNormByTheory(self, normByTheory=True):
@@ -470,6 +998,7 @@ class Sample:
         @param suffixTreeName Name of the tree
         """
         self.suffixTreeName = suffixTreeName
+        self._updateTreenameSuffix()
         return     
 
     def setNormRegions(self, normRegions):
@@ -503,22 +1032,37 @@ class Sample:
         """
         Generate all names for systematic variations for this sample"
 
+        The names are computed once per fit configuration and cached until systematics are added or removed.
+
         @param fitConfig A fit configuration to pass
-        @returns A generator to be used in loops
+        @returns An iterator to be used in loops
         """
+        try:
+            return iter(self._histogramNamesCache[fitConfig.name])
+        except KeyError:
+            pass
+
+        # data carries no systematics, so the blinding checks never apply here
+        if self.isData and self.systDict:
+            raise ValueError(f"Sample {self.name}: is data, cannot specify variation!")
+
+        names = []
+        append = names.append
+        _getName = self._getVariationHistogramName
         for name in self.systDict:
             syst = self.systDict[name]
-            for var in ["Nom", "High", "Low"]:
-                #retval.append(self.getHistogramName(fitConfig, syst.name, var))
-                yield self.getHistogramName(fitConfig, syst.name, var)
+            for var in _HIST_VARIATIONS:
+                append(_getName(syst.name, var))
 
             if syst.merged:
-                mergedName = "".join(syst.sampleList)
-                yield self.getHistogramName(fitConfig, mergedName) 
-                for var in ["Nom", "High", "Low"]:
-                    yield self.getHistogramName(fitConfig, mergedName, var) 
-    
-        #return retval
+                mergedName = syst.mergedName
+                append(_getName(mergedName, "Nom"))
+                for var in _HIST_VARIATIONS:
+                    append(_getName(mergedName, var))
+
+        names = tuple(names)
+        self._histogramNamesCache[fitConfig.name] = names
+        return iter(names)
 
     def getHistogramName(self, fitConfig, syst_name="", variation=""):
         """
@@ -531,30 +1075,32 @@ class Sample:
         if self.isData and variation != "":
             raise ValueError(f"Sample {self.name}: is data, cannot specify variation!")
 
+        regionKey = self.parentChannel.regionString
+        varKey = self.parentChannel.niceVarName
+
         # Special treatment for blinded samples
         if self.isBlinded(fitConfig):
-            return "h{}{}Blind_{}_obs".format(fitConfig.name, self.name, "".join(self.parentChannel.regions), replaceSymbols(self.parentChannel.variableName))
+            return f"h{fitConfig.name}{self.name}Blind_{regionKey}_obs"
        
         # Special treatment for data
         if self.isData:
-            return "h{}_{}_obs_{}".format(self.name, "".join(self.parentChannel.regions), replaceSymbols(self.parentChannel.variableName))
+            return f"h{self.name}_{regionKey}_obs_{varKey}"
 
         # Now on to the usual variation
-        if variation == "":
-            variation = "Nom"
+        canonical = _VAR_CANON.get(variation)
+        if canonical is None:
+            raise ValueError("Sample {}: cannot generate histogram name for unknown variation {}".format(self.name, variation))
 
-        if variation == "Up":
-            variation = "High"
+        return self._getVariationHistogramName(syst_name, canonical)
 
-        if variation == "Down":
-            variation = "Low"
-
-        variations = ["Nom", "High", "Low"]
-
-        if not variation in variations:
-            raise ValueError("Sample {}: cannot generate histogram name for unknown variation {}".format(variation))
+    def _getVariationHistogramName(self, syst_name, variation):
+        """
+        Build the name of a non-data histogram for an already validated variation
 
-        return "h{}{}{}_{}_obs_{}".format(self.name, syst_name, variation, "".join(self.parentChannel.regions), replaceSymbols(self.parentChannel.variableName))
+        @param syst_name Name of the systematic (empty for the nominal histogram)
+        @param variation One of Nom, High or Low
+        """
+        return f"h{self.name}{syst_name}{variation}_{self.parentChannel.regionString}_obs_{self.parentChannel.niceVarName}"
 
     #def propagateTreeName(self, treeName):
         #"""
@@ -576,6 +1122,7 @@ class Sample:
 
     def removeCurrentSystematic(self):
         self.currentSystematic = None
+        self._updateTreenameSuffix()
    
     def setCurrentSystematic(self, name, mode="nominal"):
         if name is None:
@@ -595,31 +1142,37 @@ class Sample:
         if _name is not None and _name not in self.systDict:
             raise ValueError(f"Sample {self.name}: cannot set systematic to unknown {_name}")
 
-        if mode.lower() == "high" or mode.lower() == "up":
+        _mode = mode.lower()
+        if _mode == "high" or _mode == "up":
             self.currentSystematic = self.systDict[_name].high
-            return
-
-        if mode.lower() == "low" or mode.lower() == "down":
+        elif _mode == "low" or _mode == "down":
             self.currentSystematic = self.systDict[_name].low
-            return
+        else:
+            self.currentSystematic = self.systDict[_name].nominal
 
-        self.currentSystematic = self.systDict[_name].nominal
+        self._updateTreenameSuffix()
 
-    def getTreenameSuffix(self):
+    def _updateTreenameSuffix(self):
+        """
+        Resolve the tree name suffix for the current systematic and sample flags.
+        Needs to be called whenever one of those changes; None means the configuration-wide
+        nominal suffix is used, which is looked up at call time as it may still change.
+        """
         if self.suffixTreeName != "" and self.currentSystematic is None:
             # no defaults if we're overruled
-            return self.suffixTreeName
-        
-        if not self.isData and not self.isQCD and not self.isDiscovery:
-
-            # are we in a systematic? if so, return that suffix
-            if self.currentSystematic is not None:
-                return self.currentSystematic
+            self._treenameSuffix = self.suffixTreeName
+        elif not self.isData and not self.isQCD and not self.isDiscovery:
+            # are we in a systematic? if so, use that suffix
+            self._treenameSuffix = self.currentSystematic
+        else:
+            self._treenameSuffix = ""
 
+    def getTreenameSuffix(self):
+        if self._treenameSuffix is None:
             # if we're not data, pick up the default
             return configMgr.nomName
 
-        return ""
+        return self._treenameSuffix
 
     def getTreename(self, suffix=""):
         """
@@ -633,10 +1186,8 @@ class Sample:
             self.prefixTreeName = self.name
             log.debug("Using name of sample as prefix for names of trees")
             
-        _suffix = ""
-        if suffix != "":
-            _suffix = copy(suffix)
-        else:
+        _suffix = suffix
+        if _suffix == "":
             _suffix = self.getTreenameSuffix()
 
         if _suffix != "":
@@ -672,38 +1223,48 @@ class Sample:
         @param nomSysName Name of the nominal systematic to generate high/low from (optional use (see source); default empty)
         @param symmetrizeEnvelope Boolean to indicate whether or not the envelope of up/down is taken as a symmetrical error
         """
+        self._sampleStringKey = None
+        systName = intern(systName)
 
         log.debug(f"addHistoSys(): building histograms {nomName} / {highName} / {lowName}")
         log.verbose(f"Using settings: includeOverallSys={includeOverallSys}, normalizeSys={normalizeSys}, symmetrize={symmetrize}, oneSide={oneSide}, symmetrizeEnvelope={symmetrizeEnvelope}") 
 
+        hists = configMgr.hists
+        integrals = _IntegralCache(hists)
+
         if oneSide and symmetrizeEnvelope:
             log.fatal(f"Cannot use oneSided histogram with symmetrizeEnvelope - use either, not both. Please check the systematic type of {nomName}")
 
         ### use-case of different tree from nominal histogram in case of 
         if len(nomSysName) > 0:
-            if configMgr.hists[nomSysName] != None:
-              if not lowName+"_test" in list(configMgr.hists.keys()) and not highName+"_test" in list(configMgr.hists.keys()):
-                configMgr.hists[lowName+"_test"] = configMgr.hists[lowName].Clone(lowName+"_test")
-                log.info(lowName + " / " + nomSysName)
-                success = configMgr.hists[lowName].Divide( configMgr.hists[nomSysName] )
-                if not success:
+            hNomSys = hists[nomSysName]
+            if hNomSys != None:
+              if not lowName+"_test" in hists and not highName+"_test" in hists:
+                hNom = hists[nomName]
+                hLow = hists[lowName]
+                hHigh = hists[highName]
+
+                # The _test entries mark the variations as transferred, also when read back from the cache.
+                # Only keep full copies of the untransferred histograms if someone is going to look at them.
+                keepCopies = configMgr.keepDebugHistograms or log.isDebug()
+
+                if keepCopies:
+                    hists[lowName+"_test"] = hLow.Clone(lowName+"_test")
+                else:
+                    hists[lowName+"_test"] = TNamed(lowName+"_test", f"{lowName} / {nomSysName} * {nomName}")
+                log.info(lowName + " / " + nomSysName + " * " + nomName)
+                if not _transferToNominal(hLow, hNomSys, hNom):
                     log.error( "Can not divide: " + lowName + " by " + nomSysName )
                     raise RuntimeError("Divide by zero.")
-                else:
-                    log.info(lowName + " * " + nomName)
-                    configMgr.hists[lowName].Multiply( configMgr.hists[nomName] )
-                    pass
                 #
-                configMgr.hists[highName+"_test"] = configMgr.hists[highName].Clone(highName+"_test")
-                log.info(highName + " * " + nomSysName)
-                success = configMgr.hists[highName].Divide( configMgr.hists[nomSysName] )
-                if not success:
+                if keepCopies:
+                    hists[highName+"_test"] = hHigh.Clone(highName+"_test")
+                else:
+                    hists[highName+"_test"] = TNamed(highName+"_test", f"{highName} / {nomSysName} * {nomName}")
+                log.info(highName + " / " + nomSysName + " * " + nomName)
+                if not _transferToNominal(hHigh, hNomSys, hNom):
                     log.error( "Can not divide: " + highName + " by " + nomSysName )
                     raise RuntimeError("Divide by zero.")
-                else:
-                    log.info(highName + " * " + nomName)
-                    configMgr.hists[highName].Multiply( configMgr.hists[nomName] )
-                    pass
 
         if self.noRenormSys and normalizeSys:
             log.debug("    sample.noRenormSys==True and normalizeSys==True for sample <%s> and syst <%s>. Setting normalizeSys to False."%(self.name, systName))
@@ -725,354 +1286,369 @@ class Sample:
         ## 1. Normalized systematics over control regions, and all sub-cases (symmetrize, includeOverallSys; symmetrizeEnvelope)
         ## 2. includeOverallSys and not normalizeSys:
         ## 3. No renormalization, and no overall-systematics
+        addCase = self._histoSysCases[(bool(normalizeSys), bool(includeOverallSys))]
+        if not addCase(self, systName, nomName, highName, lowName, integrals, includeOverallSys, symmetrize, oneSide, symmetrizeEnvelope, samName, normString, nomSysName):
+            return
 
-        if normalizeSys:
-            log.verbose("Case 1: normalized systematic")
+        if not systName in configMgr.systDict:
+            self.systList.append(systName)
+        return
 
-            if not self.normRegions: 
-                raise RuntimeError("Please specify normalization regions!")
-            
-            if symmetrize and symmetrizeEnvelope:
-                # build the envelope of up/down
-                log.verbose("Symmetrizing envelope of histogram: building error = max ( (up-nom), (nom-down) )")
-                log.verbose(f"(nom={nomName} / low={lowName} / high={highName}")
-                symmetrizeSystematicEnvelope(nomName, lowName, highName)
-            elif oneSide and symmetrize:
-                # symmetrize
-                configMgr.hists[lowName] = configMgr.hists[nomName].Clone(lowName)
-                configMgr.hists[lowName].Scale(2.0)
-                configMgr.hists[lowName].Add(configMgr.hists[highName],  -1.0)
-
-                for iBin in range(1, configMgr.hists[lowName].GetNbinsX()+1):
-                    binVal = configMgr.hists[lowName].GetBinContent(iBin)
-                    if binVal<0.:
-                        configMgr.hists[lowName].SetBinContent(iBin, 0.)
-            
-            # use different renormalization region
-            if len(self.normSampleRemap) > 0: 
-                samNameRemap = self.normSampleRemap
-                log.info(f"remapping normalization of <{samName}> to sample:  {samNameRemap}")
-            else:
-                samNameRemap = samName
-                log.debug(f"Using samNameRemap = {samName}")
 
-            highRemapName = "h"+samNameRemap+systName+"High_"+normString+"Norm"
-            lowRemapName = "h"+samNameRemap+systName+"Low_"+normString+"Norm"
-            nomRemapName = "h"+samNameRemap+"Nom_"+normString+"Norm"
+    def _addHistoSysNormalized(self, systName, nomName, highName, lowName, integrals, includeOverallSys, symmetrize, oneSide, symmetrizeEnvelope, samName, normString, nomSysName):
+        """
+        Case 1 of addHistoSys(): normalized systematics over control regions, and all sub-cases (symmetrize, includeOverallSys; symmetrizeEnvelope)
 
-            highIntegral = configMgr.hists[highRemapName].Integral()
-            lowIntegral  = configMgr.hists[lowRemapName].Integral()
-            nomIntegral  = configMgr.hists[nomRemapName].Integral()
+        @param systName Name of the systematic
+        @param nomName Nominal name for the systematic
+        @param highName Name of the +1sigma systematic value
+        @param lowName Name of the -1sigma systematic value
+        @param integrals The _IntegralCache of the addHistoSys() call
+        @returns False if the systematic was dropped
+        """
+        hists = configMgr.hists
+        highNormName = highName + "Norm"
+        lowNormName = lowName + "Norm"
 
-            log.verbose(f"Loading high remap integral from {highRemapName}: {highIntegral}")
-            log.verbose(f"Loading low remap integral from {lowRemapName}: {lowIntegral}")
-            log.verbose(f"Loading nominal remap integral from {nomRemapName}: {nomIntegral}")
-            
-            if len(nomSysName) > 0:  ## renormalization done based on consistent set of trees
-                if configMgr.hists[nomSysName] != None:
-                    nomIntegral = configMgr.hists["h"+samNameRemap+systName+"Nom_"+normString+"Norm"].Integral()
-            
-            # Attempt to symmetrize 
-            if oneSide and symmetrize:
-                log.debug("Attempting to symmetrize one-sided systematic")
-                lowIntegral = 2.*nomIntegral - highIntegral # NOTE: this is an approximation!
-                if lowIntegral < 0:
-                    lowIntegral = configMgr.hists["h"+samNameRemap+systName+"Low_"+normString+"Norm"].Integral()
-                    if lowIntegral == 0:
-                        lowIntegral = nomIntegral
-                    
-                    # clearly a problem. Revert to unsymmetrize
-                    log.warning(f"    generating HistoSys for {nomName} syst={systName} low=0. Revert to non-symmetrize.")
-                    symmetrize = False
-
-            # Construct high/low from integrals
-            try:
-                high = highIntegral / nomIntegral
-                low = lowIntegral / nomIntegral
-                log.verbose(f"Determined high and low ratios w.r.t. nominal: {high} and {low}")
-            except ZeroDivisionError:
-                log.error(f"    generating HistoSys for {nomName} syst={systName}: nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}. Systematic is removed from fit.")
-                return
+        log.verbose("Case 1: normalized systematic")
 
-            log.debug("Constructing cloned normalized histograms")
-            configMgr.hists["%sNorm" % highName] = configMgr.hists[highName].Clone("%sNorm" % highName)
-            configMgr.hists["%sNorm" % lowName] = configMgr.hists[lowName].Clone("%sNorm" % lowName)
-           
-
-            # Attempt to scale the high and low histograms down to normalized histograms
-            try:
-                log.debug(f"Scaling normalized histograms by integrals of remapped histograms: high with {1.0/high}, low with {1.0/low}")
-                configMgr.hists[highName+"Norm"].Scale(1./high)
-                configMgr.hists[lowName+"Norm"].Scale(1./low)
-            except ZeroDivisionError:
-                log.error(f"    generating HistoSys for {nomName} syst={systName}: nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}. Systematic is removed from fit.")
-                return
-            
-            # Attempt to generate an overallNormHistoSys if required
-            if includeOverallSys and not (oneSide and not symmetrize):
-                log.debug("Attempting to build overallNormHistoSys")
-                nomIntegralN = configMgr.hists[nomName].Integral()
-                lowIntegralN = configMgr.hists[lowName+"Norm"].Integral()
-                highIntegralN = configMgr.hists[highName+"Norm"].Integral()
-            
-                log.verbose("Loading high norm integral from {}: {}".format(highName+"Norm", highIntegralN))
-                log.verbose("Loading low norm integral from {}: {}".format(lowName+"Norm", lowIntegralN))
-                log.verbose(f"Loading nominal norm integral from {nomName}: {nomIntegralN}")
-
-                if nomIntegralN == 0 or highIntegralN == 0 or lowIntegralN == 0:
-                    # MB : cannot renormalize, so don't after all
-                    log.warning(f"    will not generate overallNormHistoSys for {nomName} syst={systName} nom={nomIntegralN:g} high={highIntegralN:g} low={lowIntegralN:g}. Revert to NormHistoSys.")
-                    includeOverallSys = False
-                    pass
-                else:
-                    # renormalize
-                    try:
-                        highN = highIntegralN / nomIntegralN
-                        lowN = lowIntegralN / nomIntegralN
-                    except ZeroDivisionError:
-                        log.error(f"    generating overallNormHistoSys for {nomName} syst={systName} nom={nomIntegralN:g} high={highIntegralN:g} low={lowIntegralN:g}. Systematic is removed from fit.")
-                        return
+        if not self.normRegions: 
+            raise RuntimeError("Please specify normalization regions!")
+        
+        if symmetrize and symmetrizeEnvelope:
+            # build the envelope of up/down
+            log.verbose("Symmetrizing envelope of histogram: building error = max ( (up-nom), (nom-down) )")
+            log.verbose(f"(nom={nomName} / low={lowName} / high={highName}")
+            symmetrizeSystematicEnvelope(nomName, lowName, highName)
+        elif oneSide and symmetrize:
+            # symmetrize
+            symmetrizeOneSidedSystematic(nomName, lowName, highName)
+        
+        # use different renormalization region
+        if len(self.normSampleRemap) > 0: 
+            samNameRemap = self.normSampleRemap
+            log.info(f"remapping normalization of <{samName}> to sample:  {samNameRemap}")
+        else:
+            samNameRemap = samName
+            log.debug(f"Using samNameRemap = {samName}")
+
+        remapPrefix = f"h{samNameRemap}{systName}"
+        remapSuffix = f"_{normString}Norm"
+        highRemapName = f"{remapPrefix}High{remapSuffix}"
+        lowRemapName = f"{remapPrefix}Low{remapSuffix}"
+        nomRemapName = f"h{samNameRemap}Nom{remapSuffix}"
+
+        highIntegral = integrals.get(highRemapName)
+        lowIntegral  = integrals.get(lowRemapName)
+        nomIntegral  = integrals.get(nomRemapName)
+
+        log.verbose(f"Loading high remap integral from {highRemapName}: {highIntegral}")
+        log.verbose(f"Loading low remap integral from {lowRemapName}: {lowIntegral}")
+        log.verbose(f"Loading nominal remap integral from {nomRemapName}: {nomIntegral}")
+        
+        if len(nomSysName) > 0:  ## renormalization done based on consistent set of trees
+            if hists[nomSysName] != None:
+                nomIntegral = integrals.get(f"{remapPrefix}Nom{remapSuffix}")
+        
+        # Attempt to symmetrize 
+        if oneSide and symmetrize:
+            log.debug("Attempting to symmetrize one-sided systematic")
+            lowIntegral = 2.*nomIntegral - highIntegral # NOTE: this is an approximation!
+            if lowIntegral < 0:
+                lowIntegral = integrals.get(lowRemapName)
+                if lowIntegral == 0:
+                    lowIntegral = nomIntegral
                 
-                    try:
-                        log.debug(f"Scaling normalized histograms: high with {1.0/highN}, low with {1.0/lowN}")
-                        configMgr.hists[highName+"Norm"].Scale(1./highN)
-                        configMgr.hists[lowName+"Norm"].Scale(1./lowN)
-                    except ZeroDivisionError:
-                        log.error(f"    generating overallNormHistoSys for {nomName} syst={systName} nom={nomIntegralN:g} high={highIntegralN:g} low={lowIntegralN:g} keeping in fit (offending histogram should be empty).")
-                        return
-
-
-            ## Check the shape and normalisation impact
-            #
-            # The chi2test can be performed on either the normal or the Norm histogram; since they're scaled
-            # up and down by simple numbers, there is no effect. 
-            # 
-            # The normalisation check is just performed on highN and lowN. 
-
-            #print configMgr.hists[highName+"Norm"].Integral()
-            #print configMgr.hists[lowName+"Norm"].Integral()
-
-            #print configMgr.hists[nomName].Chi2Test(configMgr.hists[highName+"Norm"], "WW UF OF P")
-            #print configMgr.hists[nomName].Chi2Test(configMgr.hists[highName], "WW UF OF P")
-
-            #print highN, lowN
-            #print high, low
-    
-            # Now, finally add the systematic
-            if oneSide and not symmetrize:
-                ## MB : avoid swapping of histograms, always pass high and nominal
-                if not configMgr.prun:
-                    self.histoSystList.append((systName, highName+"Norm", nomName, configMgr.histCacheFile, "", "", "", ""))
+                # clearly a problem. Revert to unsymmetrize
+                log.warning(f"    generating HistoSys for {nomName} syst={systName} low=0. Revert to non-symmetrize.")
+                symmetrize = False
+
+        # Construct high/low from integrals; the normalized histograms are scaled-down copies of high and low
+        if nomIntegral == 0 or highIntegral == 0 or lowIntegral == 0:
+            log.error(f"    generating HistoSys for {nomName} syst={systName}: nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}. Systematic is removed from fit.")
+            return False
+
+        high = highIntegral / nomIntegral
+        low = lowIntegral / nomIntegral
+        log.verbose(f"Determined high and low ratios w.r.t. nominal: {high} and {low}")
+
+        highScale = 1./high
+        lowScale = 1./low
+        
+        # From here on the symmetrization choice is final: a one-sided systematic that is not symmetrized
+        # only gets a HistoSys against the nominal, never an overallNormHistoSys
+        oneSidedOnly = oneSide and not symmetrize
+        wantOverallN = includeOverallSys and not oneSidedOnly
+
+        # Attempt to generate an overallNormHistoSys if required. The integrals of the normalized
+        # histograms follow from the scale factors, and the renormalization is folded into them,
+        # so the histograms only need to be scaled once.
+        if wantOverallN:
+            log.debug("Attempting to build overallNormHistoSys")
+            nomIntegralN = integrals.get(nomName)
+            lowIntegralN = integrals.get(lowName) * lowScale
+            highIntegralN = integrals.get(highName) * highScale
+        
+            log.verbose("Determined high norm integral of {}: {}".format(highNormName, highIntegralN))
+            log.verbose("Determined low norm integral of {}: {}".format(lowNormName, lowIntegralN))
+            log.verbose(f"Loading nominal norm integral from {nomName}: {nomIntegralN}")
+
+            if nomIntegralN == 0 or highIntegralN == 0 or lowIntegralN == 0:
+                # MB : cannot renormalize, so don't after all
+                log.warning(f"    will not generate overallNormHistoSys for {nomName} syst={systName} nom={nomIntegralN:g} high={highIntegralN:g} low={lowIntegralN:g}. Revert to NormHistoSys.")
+                includeOverallSys = False
+                wantOverallN = False
+                pass
+            else:
+                # renormalize
+                highN = highIntegralN / nomIntegralN
+                lowN = lowIntegralN / nomIntegralN
+
+                log.debug(f"Renormalizing normalized histograms: high with {1.0/highN}, low with {1.0/lowN}")
+                highScale /= highN
+                lowScale /= lowN
+
+        log.debug(f"Constructing normalized histograms: high scaled with {highScale}, low with {lowScale}")
+        integrals.scaledClone(highName, highNormName, highScale)
+        integrals.scaledClone(lowName, lowNormName, lowScale)
+
+        ## Check the shape and normalisation impact
+        #
+        # The chi2test can be performed on either the normal or the Norm histogram; since they're scaled
+        # up and down by simple numbers, there is no effect. 
+        # 
+        # The normalisation check is just performed on highN and lowN. 
+
+        #print hists[highName+"Norm"].Integral()
+        #print hists[lowName+"Norm"].Integral()
+
+        #print hists[nomName].Chi2Test(hists[highName+"Norm"], "WW UF OF P")
+        #print hists[nomName].Chi2Test(hists[highName], "WW UF OF P")
+
+        #print highN, lowN
+        #print high, low
+
+        # Now, finally add the systematic
+        if oneSidedOnly:
+            ## MB : avoid swapping of histograms, always pass high and nominal
+            if not configMgr.prun:
+                self.histoSystList.append(_HistoSysEntry(systName, highNormName, nomName, configMgr.histCacheFile))
+            else:
+                #checking here if systematics really affect the shape. Note that we don't need to check the normaliaztion, as this part is moved to an overallSys, that we check below
+                if checkShapeEffect(hists[nomName],hists[highNormName],hists[lowNormName]):
+                    self.histoSystList.append(_HistoSysEntry(systName, highNormName, nomName, configMgr.histCacheFile))
                 else:
-                    #checking here if systematics really affect the shape. Note that we don't need to check the normaliaztion, as this part is moved to an overallSys, that we check below
-                    if checkShapeEffect(configMgr.hists[nomName],configMgr.hists[highName+"Norm"],configMgr.hists[lowName+"Norm"]):
-                        self.histoSystList.append((systName, highName+"Norm", nomName, configMgr.histCacheFile, "", "", "", ""))
-                    else:
-                        log.info(f"Remove shape systematics {systName} for histogram {nomName} as differences smaller {configMgr.prunThreshold} or found small in chi2 test")
-                        self.systListHistoPruned.append(systName)
+                    log.info(f"Remove shape systematics {systName} for histogram {nomName} as differences smaller {configMgr.prunThreshold} or found small in chi2 test")
+                    self.systListHistoPruned.append(systName)
+        else:
+            if not configMgr.prun:
+                self.histoSystList.append(_HistoSysEntry(systName, highNormName, lowNormName, configMgr.histCacheFile))
             else:
-                if not configMgr.prun:
-                    self.histoSystList.append((systName, highName+"Norm", lowName+"Norm", configMgr.histCacheFile, "", "", "", ""))
+                #checking here if systematics really affect the shape. Note that we don't need to check the normaliaztion, as this part is moved to an overallSys, that we check below
+                if checkShapeEffect(hists[nomName],hists[highNormName],hists[lowNormName]):
+                    self.histoSystList.append(_HistoSysEntry(systName, highNormName, lowNormName, configMgr.histCacheFile))
                 else:
-                    #checking here if systematics really affect the shape. Note that we don't need to check the normaliaztion, as this part is moved to an overallSys, that we check below
-                    if checkShapeEffect(configMgr.hists[nomName],configMgr.hists[highName+"Norm"],configMgr.hists[lowName+"Norm"]):
-                        self.histoSystList.append((systName, highName+"Norm", lowName+"Norm", configMgr.histCacheFile, "", "", "", ""))
-                    else:
-                        log.info(f"Remove shape systematics {systName} for histogram {nomName} as differences smaller {configMgr.prunThreshold} or found small in chi2 test")
-                        self.systListHistoPruned.append(systName)
-                        
-            # Do we need to include an overall systematic?
-            if includeOverallSys and not (oneSide and not symmetrize):
-                #just include the systematics in case we don't prun systematics. Else check size.
-                if not configMgr.prun:
+                    log.info(f"Remove shape systematics {systName} for histogram {nomName} as differences smaller {configMgr.prunThreshold} or found small in chi2 test")
+                    self.systListHistoPruned.append(systName)
+                    
+        # Do we need to include an overall systematic?
+        if wantOverallN:
+            #just include the systematics in case we don't prun systematics. Else check size.
+            if not configMgr.prun:
+                self.addOverallSys(systName, highN, lowN)
+
+            else:
+                if max( abs(highN-1.0), abs(1.0-lowN) ) < configMgr.prunThreshold:
+                    log.info(f"    generating OverallSys for {nomName} syst={systName} nom={nomIntegralN:g} high={highIntegralN:g} low={lowIntegralN:g}. Systematic is smaller than pruning threshold ({configMgr.prunThreshold:g}) and is removed from fit.")
+                    self.systListOverallPruned.append(systName)
+                else: 
                     self.addOverallSys(systName, highN, lowN)
 
-                else:
-                    if max( abs(highN-1.0), abs(1.0-lowN) ) < configMgr.prunThreshold:
-                        log.info(f"    generating OverallSys for {nomName} syst={systName} nom={nomIntegralN:g} high={highIntegralN:g} low={lowIntegralN:g}. Systematic is smaller than pruning threshold ({configMgr.prunThreshold:g}) and is removed from fit.")
-                        self.systListOverallPruned.append(systName)
-                    else: 
-                        self.addOverallSys(systName, highN, lowN)
-            
+        return True
 
-        # Case 2
-        if includeOverallSys and not normalizeSys:
-            log.verbose("Case 2: non-normalized systematic with includeOverallSys")
-           
-            # Symmetrization efforts: either an envelope, or the usual one
-            if symmetrizeEnvelope:
-                # build the envelope of up/down
-                log.verbose("Symmetrizing envelope of histogram: building error = max ( (up-nom), (nom-down) )")
-                symmetrizeSystematicEnvelope(nomName, lowName, highName)
-            elif oneSide and symmetrize:
-                # symmetrize
-                configMgr.hists[lowName] = configMgr.hists[nomName].Clone(lowName)
-                configMgr.hists[lowName].Scale(2.0)
-                configMgr.hists[lowName].Add(configMgr.hists[highName],  -1.0)
-
-                for iBin in range(1, configMgr.hists[lowName].GetNbinsX()+1):
-                    binVal = configMgr.hists[lowName].GetBinContent(iBin)
-                    if binVal < 0.:
-                        configMgr.hists[lowName].SetBinContent(iBin, 0.)
-
-            # Now construct high and low integrals for renormalization
-            try:
-                nomIntegral = configMgr.hists[nomName].Integral()
-                lowIntegral = configMgr.hists[lowName].Integral()
-                highIntegral = configMgr.hists[highName].Integral()
-            except AttributeError:
-                log.error(f"    generating HistoSys for {nomName} syst={systName}: one of the histograms is None. Systematic is removed from fit.")
-                return
+    def _addHistoSysWithOverallSys(self, systName, nomName, highName, lowName, integrals, includeOverallSys, symmetrize, oneSide, symmetrizeEnvelope, samName, normString, nomSysName):
+        """
+        Case 2 of addHistoSys(): includeOverallSys and not normalizeSys
 
-            # Check whether a renormalization actually makes sense
-            if nomIntegral == 0 or lowIntegral == 0 or highIntegral == 0:
-                # MB : cannot renormalize, so don't after all
-                if not configMgr.prun:
-                    self.histoSystList.append((systName, highName, lowName, configMgr.histCacheFile, "", "", "", ""))
+        @param systName Name of the systematic
+        @param nomName Nominal name for the systematic
+        @param highName Name of the +1sigma systematic value
+        @param lowName Name of the -1sigma systematic value
+        @param integrals The _IntegralCache of the addHistoSys() call
+        @returns False if the systematic was dropped
+        """
+        hists = configMgr.hists
+        highNormName = highName + "Norm"
+        lowNormName = lowName + "Norm"
+
+        log.verbose("Case 2: non-normalized systematic with includeOverallSys")
+       
+        # Symmetrization efforts: either an envelope, or the usual one
+        if symmetrizeEnvelope:
+            # build the envelope of up/down
+            log.verbose("Symmetrizing envelope of histogram: building error = max ( (up-nom), (nom-down) )")
+            symmetrizeSystematicEnvelope(nomName, lowName, highName)
+        elif oneSide and symmetrize:
+            # symmetrize
+            symmetrizeOneSidedSystematic(nomName, lowName, highName)
+
+        # Now construct high and low integrals for renormalization
+        try:
+            nomIntegral = integrals.get(nomName)
+            lowIntegral = integrals.get(lowName)
+            highIntegral = integrals.get(highName)
+        except AttributeError:
+            log.error(f"    generating HistoSys for {nomName} syst={systName}: one of the histograms is None. Systematic is removed from fit.")
+            return False
+
+        # Check whether a renormalization actually makes sense
+        if nomIntegral == 0 or lowIntegral == 0 or highIntegral == 0:
+            # MB : cannot renormalize, so don't after all
+            if not configMgr.prun:
+                self.histoSystList.append(_HistoSysEntry(systName, highName, lowName, configMgr.histCacheFile))
+            else:
+                ## check shape effect
+                if checkShapeEffect(hists[nomName], hists[highName], hists[lowName] ):
+                    log.error(f"    generating HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}: cannot renormalize; only using shape")
+                    self.histoSystList.append(_HistoSysEntry(systName, highName, lowName, configMgr.histCacheFile))
                 else:
-                    ## check shape effect
-                    if checkShapeEffect(configMgr.hists[nomName], configMgr.hists[highName], configMgr.hists[lowName] ):
-                        log.error(f"    generating HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}: cannot renormalize; only using shape")
-                        self.histoSystList.append((systName, highName, lowName, configMgr.histCacheFile, "", "", "", ""))
-                    else:
-                        log.error(f"    generating HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}: cannot renormalize, no shape effect. Systematic is removed from fit.")
-                        #self.systListHistoPruned.append(systName)
-                        return
+                    log.error(f"    generating HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}: cannot renormalize, no shape effect. Systematic is removed from fit.")
+                    #self.systListHistoPruned.append(systName)
+                    return False
+        else:
+            # renormalize; all three integrals are non-zero here
+            high = highIntegral / nomIntegral
+            low = lowIntegral / nomIntegral
+
+            integrals.scaledClone(highName, highNormName, 1./high)
+            integrals.scaledClone(lowName, lowNormName, 1./low)
+
+            if not configMgr.prun:
+                self.histoSystList.append(_HistoSysEntry(systName, highNormName, lowNormName, configMgr.histCacheFile))
+                self.addOverallSys(systName, high, low)
+
             else:
-                # renormalize
-                try:
-                    high = highIntegral / nomIntegral
-                    low = lowIntegral / nomIntegral
-                except ZeroDivisionError:
-                    log.error(f"    generating HistoSys for {nomName} syst={systName}: nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}. Systematic is removed from fit.")
-                    return
-                
-                configMgr.hists[highName+"Norm"] = configMgr.hists[highName].Clone(highName+"Norm")
-                configMgr.hists[lowName+"Norm"] = configMgr.hists[lowName].Clone(lowName+"Norm")
-                
-                try:
-                    configMgr.hists[highName+"Norm"].Scale(1./high)
-                    configMgr.hists[lowName+"Norm"].Scale(1./low)
-                except ZeroDivisionError:
-                    log.error(f"    generating HistoSys for {nomName} syst={systName}: nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g} keeping in fit (offending histogram should be empty).")
-                    return
-                
-                if not configMgr.prun:
-                    self.histoSystList.append((systName, highName+"Norm", lowName+"Norm", configMgr.histCacheFile, "", "", "", ""))
+                ##check shape effect - note in this case we don't need to check the normaliaztion effect (in contrast to case 3 below), because we have already moved this part to an overallSys that we are checking separately
+                if checkShapeEffect(hists[nomName], hists[highName], hists[lowName] ):
+                    self.histoSystList.append(_HistoSysEntry(systName, highNormName, lowNormName, configMgr.histCacheFile))
+                else:
+                    log.info(f"    generating HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g} has no impact on shape. Shape effect of systematic is removed from fit.")
+                    self.systListHistoPruned.append(systName)
+                    
+                ##check norm effect
+                if max( abs(high-1.0), abs(1.0-low) ) < configMgr.prunThreshold:
+                    log.info(f"    generating OverallSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}. Systematic is smaller than pruning threshold ({configMgr.prunThreshold:g}) and is removed from fit.")
+                    self.systListOverallPruned.append(systName)
+                else: 
                     self.addOverallSys(systName, high, low)
 
-                else:
-                    ##check shape effect - note in this case we don't need to check the normaliaztion effect (in contrast to case 3 below), because we have already moved this part to an overallSys that we are checking separately
-                    if checkShapeEffect(configMgr.hists[nomName], configMgr.hists[highName], configMgr.hists[lowName] ):
-                        self.histoSystList.append((systName, highName+"Norm", lowName+"Norm", configMgr.histCacheFile, "", "", "", ""))
-                    else:
-                        log.info(f"    generating HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g} has no impact on shape. Shape effect of systematic is removed from fit.")
-                        self.systListHistoPruned.append(systName)
-                        
-                    ##check norm effect
-                    if max( abs(high-1.0), abs(1.0-low) ) < configMgr.prunThreshold:
-                        log.info(f"    generating OverallSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}. Systematic is smaller than pruning threshold ({configMgr.prunThreshold:g}) and is removed from fit.")
-                        self.systListOverallPruned.append(systName)
-                    else: 
-                        self.addOverallSys(systName, high, low)
-
-        # Case 3
-        if not includeOverallSys and not normalizeSys: # no renormalization, and no overall systematic
-            log.verbose("Case 3: non-normalized systematic without includeOverallSys")
-
-            if symmetrize and not (oneSide or symmetrizeEnvelope): ## symmetrize the systematic uncertainty
-                log.verbose("Symmetrizing histogram; _NOT_ using oneSide or symmetrizeEnvelope")
-                nomIntegral = configMgr.hists[nomName].Integral()
-                lowIntegral = configMgr.hists[lowName].Integral()
-                highIntegral = configMgr.hists[highName].Integral()
-
-                try:
-                    high = highIntegral / nomIntegral
-                    low = lowIntegral / nomIntegral
-                except ZeroDivisionError:
+        return True
+
+    def _addHistoSysShapeOnly(self, systName, nomName, highName, lowName, integrals, includeOverallSys, symmetrize, oneSide, symmetrizeEnvelope, samName, normString, nomSysName):
+        """
+        Case 3 of addHistoSys(): no renormalization, and no overall systematic
+
+        @param systName Name of the systematic
+        @param nomName Nominal name for the systematic
+        @param highName Name of the +1sigma systematic value
+        @param lowName Name of the -1sigma systematic value
+        @param integrals The _IntegralCache of the addHistoSys() call
+        @returns False if the systematic was dropped
+        """
+        hists = configMgr.hists
+        highNormName = highName + "Norm"
+        lowNormName = lowName + "Norm"
+
+        log.verbose("Case 3: non-normalized systematic without includeOverallSys")
+
+        symmetrizeTwoSided = symmetrize and not (oneSide or symmetrizeEnvelope)
+
+        if symmetrizeTwoSided: ## symmetrize the systematic uncertainty
+            log.verbose("Symmetrizing histogram; _NOT_ using oneSide or symmetrizeEnvelope")
+            nomIntegral = integrals.get(nomName)
+            lowIntegral = integrals.get(lowName)
+            highIntegral = integrals.get(highName)
+
+            if nomIntegral == 0:
+                log.error(f"    generating HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}. Systematic is removed from fit.")
+                return False
+
+            high = highIntegral / nomIntegral
+            low = lowIntegral / nomIntegral
+
+            if high < 1.0 and 1.0 > low > 0.0:
+                log.warning(f"    addHistoSys for {systName}: high={high:f} is < 1.0. Taking symmetric value from low {low:f} => {2.-low:f}")
+                if high == 0:
                     log.error(f"    generating HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}. Systematic is removed from fit.")
-                    return
-
-                if high < 1.0 and 1.0 > low > 0.0:
-                    log.warning(f"    addHistoSys for {systName}: high={high:f} is < 1.0. Taking symmetric value from low {low:f} => {2.-low:f}")
-                    configMgr.hists[highName+"Norm"] = configMgr.hists[highName].Clone(highName+"Norm")
-                    try:
-                        configMgr.hists[highName+"Norm"].Scale((2.0-low)/high)
-                    except ZeroDivisionError:
-                        log.error(f"    generating HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}. Systematic is removed from fit.")
-                        return
-                    self.histoSystList.append((systName, highName+"Norm", lowName, configMgr.histCacheFile, "", "", "", ""))
-                elif low > 1.0 and high > 1.0:
-                    log.warning("    addHistoSys for %s: low=%f is > 1.0. Taking symmetric value from high %f => %f"% (systName, low, high, 2.-high))
-                    configMgr.hists[lowName+"Norm"] = configMgr.hists[lowName].Clone(lowName+"Norm")
-                    try:
-                        configMgr.hists[lowName+"Norm"].Scale((2.0-high)/low)
-                    except ZeroDivisionError:
-                        log.error(f"    generating HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g}. Systematic is removed from fit.")
-                        return
-                    self.histoSystList.append((systName, highName, lowName+"Norm", configMgr.histCacheFile, "", "", "", ""))
-                elif low < 0.0:
-                    log.warning(f"    addHistoSys for {systName}: low={low:f} is < 0.0. Setting negative bins to 0.0.")
-                    configMgr.hists[lowName+"Norm"] = configMgr.hists[lowName].Clone(lowName+"Norm")
-                    for iBin in range(1, configMgr.hists[lowName+"Norm"].GetNbinsX()+1):
-                        if configMgr.hists[lowName+"Norm"].GetBinContent(iBin) < 0.:
-                            configMgr.hists[lowName+"Norm"].SetBinContent(iBin, 0.)
-                    self.histoSystList.append((systName, highName, lowName+"Norm", configMgr.histCacheFile, "", "", "", ""))
-                else:
-                    self.histoSystList.append((systName, highName, lowName, configMgr.histCacheFile, "", "", "", ""))
-            elif symmetrize and oneSide:
-                log.verbose("Symmetrizing one-sided histogram: building low=(2*nominal)-high")
-                # symmetrize one-side systematic, nothing else
-                configMgr.hists[lowName] = configMgr.hists[nomName].Clone(lowName)
-                configMgr.hists[lowName].Scale(2.0)
-                configMgr.hists[lowName].Add(configMgr.hists[highName], -1.0)
-
-                for iBin in range(1, configMgr.hists[lowName].GetNbinsX()+1):
-                    binVal = configMgr.hists[lowName].GetBinContent(iBin)
-                    if binVal < 0.:
-                        configMgr.hists[lowName].SetBinContent(iBin, 0.)
-
-                self.histoSystList.append((systName, highName, lowName, configMgr.histCacheFile, "", "", "", "")) 
-            elif symmetrize and symmetrizeEnvelope:
-                log.verbose("Symmetrizing envelope of histogram: building error = max ( (up-nom), (nom-down) )")
-                symmetrizeSystematicEnvelope(nomName, lowName, highName)
-                
-                self.histoSystList.append((systName, highName, lowName, configMgr.histCacheFile, "", "", "", ""))
-                
-            else: # default: don't do anything special
-                log.verbose("Adding a simple variation")
-
-                nomIntegral = configMgr.hists[nomName].Integral()
-                lowIntegral = configMgr.hists[lowName].Integral()
-                highIntegral = configMgr.hists[highName].Integral()
-
-                if configMgr.prun:
-                    keepNorm = True
-                    if not checkNormalizationEffect(configMgr.hists[nomName], configMgr.hists[highName], configMgr.hists[lowName], configMgr.prunThreshold):
-                        log.debug(f"    HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g} has small impact on normalisation.")
-                        keepNorm = False
-
-                    if not checkShapeEffect(configMgr.hists[nomName], configMgr.hists[highName], configMgr.hists[lowName]):
-                        if not keepNorm:
-                            log.info(f"    HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g} has small impact on normalisation and no effect on shape. Removing from fit.")
-                            self.systListHistoPruned.append(systName)
-                            return
-                        
-                        #log.error("    HistoSys for {} syst={} nom={:g} high={:g} low={:g} has small impact on shape. Using normalisation only.".format(nomName, systName, nomIntegral, highIntegral, lowIntegral))
-
-                        #for i in xrange(0, configMgr.hists[nomName].GetNbinsX()+2):
-                        #    configMgr.hists[lowName].SetBinContent(i, configMgr.hists[nomName].GetBinContent(i))
-                        #    configMgr.hists[highName].SetBinContent(i, configMgr.hists[nomName].GetBinContent(i))
-                        
-                        #configMgr.hists[lowName].Scale(lowIntegral)
-                        #configMgr.hists[highName].Scale(highIntegral)
-
-                self.histoSystList.append((systName, highName, lowName, configMgr.histCacheFile, "", "", "", ""))
-
-        if not systName in list(configMgr.systDict.keys()):
-            self.systList.append(systName)
-        return
+                    return False
+                highScale = (2.0-low)/high
+                integrals.scaledClone(highName, highNormName, highScale)
+                self.histoSystList.append(_HistoSysEntry(systName, highNormName, lowName, configMgr.histCacheFile))
+            elif low > 1.0 and high > 1.0:
+                log.warning("    addHistoSys for %s: low=%f is > 1.0. Taking symmetric value from high %f => %f"% (systName, low, high, 2.-high))
+                lowScale = (2.0-high)/low
+                integrals.scaledClone(lowName, lowNormName, lowScale)
+                self.histoSystList.append(_HistoSysEntry(systName, highName, lowNormName, configMgr.histCacheFile))
+            elif low < 0.0:
+                log.warning(f"    addHistoSys for {systName}: low={low:f} is < 0.0. Setting negative bins to 0.0.")
+                hLowNorm = integrals.clone(lowName, lowNormName)
+                # only the bins themselves are truncated, not the under- and overflow
+                inner = _cellContents(hLowNorm)[1:-1]
+                _setCellContents(hLowNorm, np.clip(inner, 0.0, None), 1)
+                hLowNorm.ResetStats()
+                integrals.forget(lowNormName)
+                self.histoSystList.append(_HistoSysEntry(systName, highName, lowNormName, configMgr.histCacheFile))
+            else:
+                self.histoSystList.append(_HistoSysEntry(systName, highName, lowName, configMgr.histCacheFile))
+        elif symmetrize and oneSide:
+            log.verbose("Symmetrizing one-sided histogram: building low=(2*nominal)-high")
+            # symmetrize one-side systematic, nothing else
+            symmetrizeOneSidedSystematic(nomName, lowName, highName)
+
+            self.histoSystList.append(_HistoSysEntry(systName, highName, lowName, configMgr.histCacheFile)) 
+        elif symmetrize and symmetrizeEnvelope:
+            log.verbose("Symmetrizing envelope of histogram: building error = max ( (up-nom), (nom-down) )")
+            symmetrizeSystematicEnvelope(nomName, lowName, highName)
+            
+            self.histoSystList.append(_HistoSysEntry(systName, highName, lowName, configMgr.histCacheFile))
+            
+        else: # default: don't do anything special
+            log.verbose("Adding a simple variation")
+
+            nomIntegral = integrals.get(nomName)
+            lowIntegral = integrals.get(lowName)
+            highIntegral = integrals.get(highName)
+
+            if configMgr.prun:
+                keepNorm = checkNormalizationEffect(hists[nomName], hists[highName], hists[lowName], configMgr.prunThreshold,
+                                                    nomIntegral, highIntegral, lowIntegral)
+                if not keepNorm:
+                    log.debug(f"    HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g} has small impact on normalisation.")
+
+                if not checkShapeEffect(hists[nomName], hists[highName], hists[lowName]):
+                    if not keepNorm:
+                        log.info(f"    HistoSys for {nomName} syst={systName} nom={nomIntegral:g} high={highIntegral:g} low={lowIntegral:g} has small impact on normalisation and no effect on shape. Removing from fit.")
+                        self.systListHistoPruned.append(systName)
+                        return False
+                    
+                    #log.error("    HistoSys for {} syst={} nom={:g} high={:g} low={:g} has small impact on shape. Using normalisation only.".format(nomName, systName, nomIntegral, highIntegral, lowIntegral))
 
+                    #for i in xrange(0, configMgr.hists[nomName].GetNbinsX()+2):
+                    #    configMgr.hists[lowName].SetBinContent(i, configMgr.hists[nomName].GetBinContent(i))
+                    #    configMgr.hists[highName].SetBinContent(i, configMgr.hists[nomName].GetBinContent(i))
+                    
+                    #configMgr.hists[lowName].Scale(lowIntegral)
+                    #configMgr.hists[highName].Scale(highIntegral)
+
+            self.histoSystList.append(_HistoSysEntry(systName, highName, lowName, configMgr.histCacheFile))
+
+        return True
+
+    ## addHistoSys() implementation by (normalizeSys, includeOverallSys)
+    _histoSysCases = {(True, True): _addHistoSysNormalized,
+                      (True, False): _addHistoSysNormalized,
+                      (False, True): _addHistoSysWithOverallSys,
+                      (False, False): _addHistoSysShapeOnly}
 
     def addShapeSys(self, systName, nomName, highName, lowName, constraintType="Gaussian"):
         """
@@ -1084,43 +1660,34 @@ class Sample:
         @param lowName Name of the systematic corresponding to -1sigma
         @param constraintType Type of the constraint in a string (default 'Gaussian')
         """
+        self._sampleStringKey = None
+
+        hists = configMgr.hists
 
         highHistName = highName + "Norm"
-        configMgr.hists[highHistName] = configMgr.hists[highName].Clone(highHistName)
+        hists[highHistName] = hists[highName].Clone(highHistName)
 
         lowHistName = lowName + "Norm"
-        configMgr.hists[lowHistName]  = configMgr.hists[lowName].Clone(lowHistName)
+        hists[lowHistName]  = hists[lowName].Clone(lowHistName)
 
         nomHistName = nomName + "Norm"
-        configMgr.hists[nomHistName]  = configMgr.hists[nomName].Clone(nomHistName)
-
-        for iBin in range(configMgr.hists[highHistName].GetNbinsX()+1):
-            try:
-                configMgr.hists[highHistName].SetBinContent(iBin,  fabs((configMgr.hists[highHistName].GetBinContent(iBin) / configMgr.hists[nomName].GetBinContent(iBin)) - 1.0) )
-                configMgr.hists[highHistName].SetBinError(iBin, 0.)
-            except ZeroDivisionError:
-                configMgr.hists[highHistName].SetBinContent(iBin, 0.)
-                configMgr.hists[highHistName].SetBinError(iBin, 0.)
-
-        for iBin in range(configMgr.hists[lowHistName].GetNbinsX()+1):
-            try:
-                configMgr.hists[lowHistName].SetBinContent(iBin,  fabs((configMgr.hists[lowHistName].GetBinContent(iBin) / configMgr.hists[nomName].GetBinContent(iBin)) - 1.0) )
-                configMgr.hists[lowHistName].SetBinError(iBin, 0.)
-            except ZeroDivisionError:
-                configMgr.hists[lowHistName].SetBinContent(iBin, 0.)
-                configMgr.hists[lowHistName].SetBinError(iBin, 0.)
-
-        for iBin in range(configMgr.hists[nomHistName].GetNbinsX()+1):
-            try:
-                configMgr.hists[nomHistName].SetBinContent(iBin, max( configMgr.hists[highHistName].GetBinContent(iBin),
-                                                                      configMgr.hists[lowHistName].GetBinContent(iBin)))
-                log.debug(f"!!!!!! shapeSys {systName} bin {iBin:g} value {configMgr.hists[nomHistName].GetBinContent(iBin):g}")
-                configMgr.hists[nomHistName].SetBinError(iBin, 0.)
-            except ZeroDivisionError:
-                configMgr.hists[nomHistName].SetBinContent(iBin, 0.)
-                configMgr.hists[nomHistName].SetBinError(iBin, 0.)
-
-        if not systName in list(configMgr.systDict.keys()):
+        hists[nomHistName]  = hists[nomName].Clone(nomHistName)
+
+        # the underflow and the bins are filled, the overflow keeps the content of the clone
+        nFilled = hists[nomHistName].GetNbinsX()+1
+        nom = _cellContents(hists[nomName])[:nFilled]
+        high = _relativeDeviation(_cellContents(hists[highHistName])[:nFilled], nom)
+        low = _relativeDeviation(_cellContents(hists[lowHistName])[:nFilled], nom)
+
+        _setShapeContents(hists[highHistName], high)
+        _setShapeContents(hists[lowHistName], low)
+        _setShapeContents(hists[nomHistName], np.maximum(high, low))
+
+        if log.isDebug():
+            values = np.array2string(_cellContents(hists[nomHistName])[:nFilled], precision=4)
+            log.debug(f"!!!!!! shapeSys {systName} values from underflow to last bin: {values}")
+
+        if not systName in configMgr.systDict:
             self.systList.append(systName)
 
         return
@@ -1135,22 +1702,30 @@ class Sample:
         @param constraintType String indicating the type of costraint (default Gaussian)
         @param statErrorThreshold Optional threshold for size of the error; any bins for which the error is below this ratio are ignored
         """
+        self._sampleStringKey = None
+        hists = configMgr.hists
         histName = nomName + "Norm"
-        configMgr.hists[histName]  = configMgr.hists[nomName].Clone(histName)
-
-        for iBin in range(configMgr.hists[histName].GetNbinsX()+1):
-            try:
-                ratio = configMgr.hists[nomName].GetBinError(iBin) / configMgr.hists[nomName].GetBinContent(iBin)
-                if (statErrorThreshold is not None) and (ratio<statErrorThreshold): 
-                    log.info( f"shapeStat {systName} bin {iBin:g} value {ratio:g}, below threshold of: {statErrorThreshold:g}. Will ignore." )
-                    ratio = 0.0   ## don't show if below threshold
-                configMgr.hists[histName].SetBinContent( iBin, ratio )
-                configMgr.hists[histName].SetBinError( iBin, 0. )
-                log.debug(f"!!!!!! shapeStat {systName} bin {iBin:g} value {configMgr.hists[histName].GetBinContent(iBin):g}" )
-            except ZeroDivisionError:
-                configMgr.hists[histName].SetBinContent( iBin, 0. )
-                configMgr.hists[histName].SetBinError( iBin, 0.)
-        if not systName in list(configMgr.systDict.keys()):
+        hists[histName]  = hists[nomName].Clone(histName)
+
+        # the underflow and the bins are filled, the overflow keeps the content of the clone
+        nFilled = hists[histName].GetNbinsX()+1
+        content = _cellContents(hists[nomName])[:nFilled]
+        error = np.sqrt(_binErrorsSquared(hists[nomName])[:nFilled])
+        ratio = np.divide(error, content, out=np.zeros(nFilled), where=(content != 0))
+
+        if statErrorThreshold is not None:
+            belowThreshold = (ratio < statErrorThreshold)
+            ignored = np.flatnonzero(belowThreshold & (content != 0))
+            if ignored.size > 0:
+                log.info( f"shapeStat {systName}: {ignored.size:d}/{nFilled:d} bin(s) {ignored.tolist()} below threshold of: {statErrorThreshold:g}. Will ignore." )
+            ratio[belowThreshold] = 0.0   ## don't show if below threshold
+
+        _setShapeContents(hists[histName], ratio)
+
+        if log.isDebug():
+            for (iBin, value) in enumerate(_cellContents(hists[histName])[:nFilled]):
+                log.debug(f"!!!!!! shapeStat {systName} bin {iBin:g} value {value:g}" )
+        if not systName in configMgr.systDict:
             self.systList.append(systName)
         return
 
@@ -1163,56 +1738,23 @@ class Sample:
         @param high Value at +1sigma
         @param low Value at -1sigma
         """
-        
-        if high == 1.0 and low == 1.0:
-            log.warning("    addOverallSys for %s: high == 1.0 and low == 1.0. Systematic is removed from fit" % systName)
-            return
-
-        if high == 0.0 and low == 0.0:
-            log.warning(f"    addOverallSys for {systName}: high={high:g} low={low:g}. Systematic is removed from fit.")
-            return
+        self._sampleStringKey = None
 
-        if high == low:
-            low = 2.0 - high
-            log.error("    addOverallSys '%s' has invalid inputs: high == low == %.3f.\n    This would result in error=(high-low)/(high+low)=0, silently cancelled by HistFactory.\n    Please fix your user configuration.\n    For now, will recover by symmetrizing error: high=%.3f low=%.3f."%(systName,high,high,low))
-
-        if high == 1.0 and low > 0.0 and low != 1.0:
-            highOld = high
-            high = 2.0 - low
-            log.warning(f"    addOverallSys for {systName}: high={highOld:g}. Taking symmetric value from low {low:g} => {high:g}")
-
-        if low == 1.0 and high > 0.0 and high != 1.0:
-            lowOld = low
-            low = 2.0 - high
-            log.warning(f"    addOverallSys for {systName}: low={lowOld:g}. Taking symmetric value from high {low:g} => {high:g}")
-
-        if low < 0.01:
-            log.warning(f"    addOverallSys for {systName}: low={low:g} is < 0.01. Setting to low=0.01. High={high:g}.")
-            low = 0.01
-
-        if high < 0.01:
-            log.warning(f"    addOverallSys for {systName}: high={high:g} is < 0.01. Setting to high=0.01. Low={low:g}.")
-            high = 0.01
-      
-        #print high, high == 1.0
-        #print low, low == 1.0
-
-        # Perform these checks again after the symmetrisation
-        if fabs(high-1.0) < 1E-5 and fabs(low-1.0) < 1E-5:
-            log.warning("    addOverallSys for %s: high == 1.0 and low == 1.0. Systematic is removed from fit" % systName)
+        # stored as plain floats, so the XML and HistFactory writers can use them as they are
+        systName = intern(systName)
+        sanitized = _sanitizeOverallSys(systName, float(high), float(low))
+        if sanitized is None:
             return
+        (high, low) = sanitized
 
-        if fabs(high) < 1E-5 and fabs(low) < 1E-5:
-            log.warning(f"    addOverallSys for {systName}: high={high:g} low={low:g}. Systematic is removed from fit.")
-            return
-          
-        if configMgr.prun and fabs(high-1.0) < configMgr.prunThreshold and fabs(low-1.0) < configMgr.prunThreshold:
+        if configMgr.prun and abs(high-1.0) < configMgr.prunThreshold and abs(low-1.0) < configMgr.prunThreshold:
             log.info(f"    addOverallSys for {systName}: high={high:g} low={low:g}. Pruning theshold={configMgr.prunThreshold:g}. Systematic is removed from fit.")
             self.systListOverallPruned.append(systName)
             return
 
-        self.overallSystList.append((systName, high, low))
-        if not systName in list(configMgr.systDict.keys()):
+        entry = (systName, high, low)
+        self.overallSystList.append(entry)
+        if not systName in configMgr.systDict:
             self.systList.append(systName)
         return
 
@@ -1226,8 +1768,10 @@ class Sample:
         @param low Value at -1sigma
         @param const Boolean that indicates whether the factor is constant or not
         """
-        self.normFactor.append( (name, val, high, low, const) )
-        if not name in configMgr.normList:
+        self._sampleStringKey = None
+        self.normFactor.append( (name, float(val), float(high), float(low), const) )
+        if not name in configMgr._normSet:
+            configMgr._normSet.add(name)
             configMgr.normList.append(name)
         return
 
@@ -1241,9 +1785,11 @@ class Sample:
         @param low Value at -1sigma
         @param const Boolean that indicates whether the factor is constant or not
         """
+        self._sampleStringKey = None
         self.normFactor = []
-        self.normFactor.append( (name, val, high, low, const) )
-        if not name in configMgr.normList:
+        self.normFactor.append( (name, float(val), float(high), float(low), const) )
+        if not name in configMgr._normSet:
+            configMgr._normSet.add(name)
             configMgr.normList.append(name)
         return
 
@@ -1266,6 +1812,12 @@ class Sample:
         #log.warning("file = {}".format(filename))
         #log.warning("tree = {}".format(_treename))
 
+        # only build the InputTree the first time a combination is seen
+        key = (filename, _treename)
+        if key in self._inputKeys:
+            return
+
+        self._inputKeys.add(key)
         self.input_files.add(InputTree(filename, _treename, friends))
 
         # we are the leaves of the configMgr->fitConfig->channel->sample tree,
@@ -1313,6 +1865,7 @@ class Sample:
 
         @param name Name of the shape factor
         """
+        self._sampleStringKey = None
         self.shapeFactorList.append(name)
 
     def addSystematic(self, syst):
@@ -1326,10 +1879,15 @@ class Sample:
             return
         
         log.verbose(f"Adding systematic {syst.name} to sample {self.name} ({hex(id(self))})")
-        if syst.name in list(self.systDict.keys()):
-            raise Exception(f"Attempt to overwrite systematic {syst.name} in Sample {self.name} ({hex(id(self))})")
+        # systematic names are looked up over and over while building the model; keep a single copy of each
+        name = intern(syst.name)
+        if name in self.systDict:
+            raise Exception(f"Attempt to overwrite systematic {name} in Sample {self.name} ({hex(id(self))})")
         else:
-            self.systDict[syst.name] = syst.Clone()
+            self.systDict[name] = syst.Clone()
+            if syst.type == "weight":
+                self._weightSysts[name] = self.systDict[name]
+            self._histogramNamesCache.clear()
             return
 
     def getOverallSys(self, name):
@@ -1338,9 +1896,10 @@ class Sample:
 
         @param name Name of the systematic to return
         """
-        for syst in self.overallSystList:
-            if name == syst[0]: return syst
-        return None
+        idx = _findEntry(self.overallSystList, self._overallSystIndex, name)
+        if idx is None:
+            return None
+        return self.overallSystList[idx]
 
     def replaceOverallSys(self, rsyst):
         """
@@ -1348,11 +1907,10 @@ class Sample:
 
         @param rsyst Systematic object to replace the systematic with the same name
         """
-        for idx in range(len(self.overallSystList)):
-            syst = self.overallSystList[idx]
-            if rsyst[0]==syst[0]:
-                self.overallSystList[idx] = rsyst
-                return
+        self._sampleStringKey = None
+        idx = _findEntry(self.overallSystList, self._overallSystIndex, rsyst[0])
+        if idx is not None:
+            self.overallSystList[idx] = rsyst
 
     def getHistoSys(self, name):
         """
@@ -1360,9 +1918,10 @@ class Sample:
 
         @param name Name of the histoSys systematic
         """
-        for syst in self.histoSystList:
-            if name == syst[0]: return syst
-        return None
+        idx = _findEntry(self.histoSystList, self._histoSystIndex, name)
+        if idx is None:
+            return None
+        return self.histoSystList[idx]
 
     def replaceHistoSys(self, rsyst):
         """
@@ -1370,11 +1929,10 @@ class Sample:
 
         @param rsyst Systematic object to replace the systematic with the same name
         """
-        for idx in range(len(self.histoSystList)):
-            syst = self.histoSystList[idx]
-            if rsyst[0]==syst[0]:
-                self.histoSystList[idx] = rsyst
-                return
+        self._sampleStringKey = None
+        idx = _findEntry(self.histoSystList, self._histoSystIndex, rsyst[0])
+        if idx is not None:
+            self.histoSystList[idx] = rsyst
 
     def removeOverallSys(self, systName):
         """
@@ -1382,19 +1940,22 @@ class Sample:
 
         @param systName Name of the overall systematic to remove
         """
-        for idx in range(len(self.overallSystList)):
-            syst = self.overallSystList[idx]
-            if systName==syst[0]:
-                del self.overallSystList[idx]
-                self.removeSystematic(systName)
-                return
+        self._sampleStringKey = None
+        idx = _findEntry(self.overallSystList, self._overallSystIndex, systName)
+        if idx is None:
+            return
+
+        del self.overallSystList[idx]
+        # the later entries moved up; a later entry of the same name becomes the first one
+        self._overallSystIndex.clear()
+        self.removeSystematic(systName)
 
     def getAllSystematicNames(self):
         """
-        Get all names of systematics associated to this sample
+        Get all names of systematics associated to this sample, as a view that follows later changes
         """
 
-        return list(self.systDict.keys())
+        return self.systDict.keys()
 
     def getAllSystematics(self):
         """
@@ -1413,7 +1974,7 @@ class Sample:
         # protection against strange people who use getSystematic 
         # with the object they want to retrieve
         name = systName
-        if isinstance(systName, SystematicBase):
+        if type(systName) is not str and isinstance(systName, SystematicBase):
             name = systName.name
         try:
             return self.systDict[name]
@@ -1430,10 +1991,12 @@ class Sample:
         """
         # do we get a name or a Systematic passed?
         name = systName
-        if isinstance(systName, SystematicBase):
+        if type(systName) is not str and isinstance(systName, SystematicBase):
             name = systName.name
 
         del self.systDict[name]
+        self._weightSysts.pop(name, None)
+        self._histogramNamesCache.clear()
 
     def clearSystematics(self):
         """
@@ -1441,6 +2004,8 @@ class Sample:
         """
         log.verbose(f"Clearing systematics for {self.name} ({hex(id(self))})") 
         self.systDict.clear()
+        self._weightSysts.clear()
+        self._histogramNamesCache.clear()
  
     def replaceSystematic(self, old, new):
         """
@@ -1458,59 +2023,102 @@ class Sample:
         """
         Construct the HistFactory object for this sample
         """
-        s = ROOT.RooStats.HistFactory.Sample(self.name, self.histoName, configMgr.histCacheFile)
+        cacheFile = configMgr.histCacheFile
+        s = ROOT.RooStats.HistFactory.Sample(self.name, self.histoName, cacheFile)
         s.SetNormalizeByTheory(self.normByTheory)
         if self.statConfig:
             s.ActivateStatError()
        
-        #high = 1, low = 2
-        for histoSys in self.histoSystList:
-            s.AddHistoSys(histoSys[0], histoSys[2], configMgr.histCacheFile, "", 
-                                       histoSys[1], configMgr.histCacheFile, "")
+        # the PyROOT methods are only looked up for the kinds of entries the sample has
+        histoSystList = self.histoSystList
+        shapeSystList = self.shapeSystList
+        overallSystList = self.overallSystList
+        shapeFactorList = self.shapeFactorList
+        normFactorList = self.normFactor
 
-        for shapeSys in self.shapeSystList:
-            constraintType = ROOT.RooStats.HistFactory.Constraint.GetType(shapeSys[2])
-            s.AddShapeSys(shapeSys[0], constraintType, shapeSys[1], configMgr.histCacheFile)
+        #high = 1, low = 2
+        if histoSystList:
+            AddHistoSys = s.AddHistoSys
+            for histoSys in histoSystList:
+                (name, high, low) = _get012(histoSys)
+                AddHistoSys(name, low, cacheFile, "", high, cacheFile, "")
+
+        if shapeSystList:
+            AddShapeSys = s.AddShapeSys
+            GetConstraintType = ROOT.RooStats.HistFactory.Constraint.GetType
+            for shapeSys in shapeSystList:
+                (name, histoName, constraint) = _get012(shapeSys)
+                AddShapeSys(name, GetConstraintType(constraint), histoName, cacheFile)
 
         # high = 1, low = 2
-        for overallSys in self.overallSystList:
-            s.AddOverallSys(overallSys[0], overallSys[2], overallSys[1])
+        if overallSystList:
+            AddOverallSys = s.AddOverallSys
+            for overallSys in overallSystList:
+                (name, high, low) = _get012(overallSys)
+                AddOverallSys(name, low, high)
 
-        for shapeFact in self.shapeFactorList:
-            s.AddShapeFactor(shapeFact)
+        if shapeFactorList:
+            AddShapeFactor = s.AddShapeFactor
+            for shapeFact in shapeFactorList:
+                AddShapeFactor(shapeFact)
 
         # high = 2, low = 3
-        if len(self.normFactor) > 0:
-            for normFactor in self.normFactor:
-                s.AddNormFactor(normFactor[0], normFactor[1], normFactor[3], normFactor[2], normFactor[4])
+        if normFactorList:
+            AddNormFactor = s.AddNormFactor
+            for normFactor in normFactorList:
+                (name, val, high, low, const) = _get01234(normFactor)
+                AddNormFactor(name, val, low, high, const)
 
         return s
 
+    def _getSampleStringKey(self):
+        """
+        Return everything __str__() depends on; the lists are changed in place from outside this class too, so their entries are part of it
+        """
+        return (configMgr.histCacheFile, self.name, self.histoName, self.normByTheory, self.statConfig,
+                tuple(self.histoSystList), tuple(self.shapeSystList), tuple(self.overallSystList),
+                tuple(self.shapeFactorList), tuple(self.normFactor))
+
     def __str__(self):
         """
         Convert instance to XML string
         """
-        self.sampleString = "  <Sample Name=\"%s\" HistoName=\"%s\" InputFile=\"%s\" NormalizeByTheory=\"%s\">\n"  % (self.name, self.histoName, configMgr.histCacheFile, self.normByTheory)
+        key = self._getSampleStringKey()
+        if self._sampleStringKey == key:
+            return self.sampleString
+
+        buf = StringIO()
+        write = buf.write
+        write(_SAMPLE_FMT % (_xmlAttr(self.name), _xmlAttr(self.histoName), _xmlAttr(configMgr.histCacheFile), self.normByTheory))
         
         if self.statConfig:
-            self.sampleString += "    <StatError Activate=\"%s\"/>\n" % self.statConfig
-        
-        for histoSyst in self.histoSystList:
-            self.sampleString += f"    <HistoSys Name=\"{histoSyst[0]}\" HistoNameHigh=\"{histoSyst[1]}\" HistoNameLow=\"{histoSyst[2]}\" />\n"
-        
-        for shapeSyst in self.shapeSystList:
-            self.sampleString += f"    <ShapeSys Name=\"{shapeSyst[0]}\" HistoName=\"{shapeSyst[1]}\" ConstraintType=\"{shapeSyst[2]}\"/>\n"
-        
-        for overallSyst in self.overallSystList:
-            self.sampleString += f"    <OverallSys Name=\"{overallSyst[0]}\" High=\"{float(overallSyst[1]):g}\" Low=\"{float(overallSyst[2]):g}\" />\n"
-        
-        for shapeFact in self.shapeFactorList:
-            self.sampleString += "    <ShapeFactor Name=\"%s\" />\n" % shapeFact
-        
-        if len(self.normFactor)>0:
-            for normFactor in self.normFactor:
-                self.sampleString += f"    <NormFactor Name=\"{normFactor[0]}\" Val=\"{normFactor[1]:g}\" High=\"{normFactor[2]:g}\" Low=\"{normFactor[3]:g}\" Const=\"{normFactor[4]}\" />\n"
-                pass
+            write(_STATERR_FMT % self.statConfig)
         
-        self.sampleString += "  </Sample>\n\n"
+        histoSystList = self.histoSystList
+        shapeSystList = self.shapeSystList
+        overallSystList = self.overallSystList
+        shapeFactorList = self.shapeFactorList
+        normFactorList = self.normFactor
+
+        # names and file paths are escaped, the numbers and flags can be written as they are
+        if histoSystList:
+            write("".join([_HISTOSYS_FMT % (_xmlAttr(name), _xmlAttr(high), _xmlAttr(low))
+                           for (name, high, low) in map(_get012, histoSystList)]))
+        if shapeSystList:
+            write("".join([_SHAPESYS_FMT % (_xmlAttr(name), _xmlAttr(histoName), _xmlAttr(constraint))
+                           for (name, histoName, constraint) in map(_get012, shapeSystList)]))
+        if overallSystList:
+            write("".join([_OVERALLSYS_FMT % (_xmlAttr(name), high, low)
+                           for (name, high, low) in map(_get012, overallSystList)]))
+        if shapeFactorList:
+            write("".join([_SHAPEFACT_FMT % _xmlAttr(shapeFact) for shapeFact in shapeFactorList]))
+        if normFactorList:
+            write("".join([_NORMFACT_FMT % (_xmlAttr(name), val, high, low, const)
+                           for (name, val, high, low, const) in map(_get01234, normFactorList)]))
+
+        write(_SAMPLE_END)
+
+        # the attribute is only set once the string is complete
+        self.sampleString = buf.getvalue()
+        self._sampleStringKey = key
         return self.sampleString
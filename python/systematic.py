@@ -50,6 +50,7 @@ class SystematicBase:
         self.low = low  # What is the -1sig tree name or weights list?
         self.sampleList = []
         self.merged = False
+        self._mergedName = None
         self.nFound = 0
         self.filesHi = {}
         self.filesLo = {}
@@ -57,6 +58,9 @@ class SystematicBase:
         self.treeHiName = {}
         self.allowRemapOfSyst = False
         self.differentNominalTreeWeight = False
+        # membership sets for the high/low weight lists; built on first use
+        self._highWeightSet = None
+        self._lowWeightSet = None
 
         if not constraint == "Gaussian" and not (method == "shapeSys" or method == "shapeStat"):
             raise ValueError("Constraints can only be specified for shapeSys")
@@ -83,8 +87,49 @@ class SystematicBase:
         newSyst = deepcopy(self)
         if not name == "":
             newSyst.name = name
+        newSyst._highWeightSet = None
+        newSyst._lowWeightSet = None
         return newSyst
 
+    def _getWeightSets(self):
+        """
+        Return the membership sets of the high and low weight lists, building them if needed
+        """
+        if self._highWeightSet is None:
+            self._highWeightSet = set(self.high)
+            self._lowWeightSet = set(self.low)
+        return (self._highWeightSet, self._lowWeightSet)
+
+    def addWeight(self, weight):
+        """
+        Append a weight to the high and low weight lists, unless already present
+
+        @param weight The weight to add
+        """
+        (highSet, lowSet) = self._getWeightSets()
+        if not weight in highSet:
+            self.high.append(weight)
+            highSet.add(weight)
+        if not weight in lowSet:
+            self.low.append(weight)
+            lowSet.add(weight)
+        return
+
+    def removeWeight(self, weight):
+        """
+        Remove a weight from the high and low weight lists, if present
+
+        @param weight The weight to remove
+        """
+        (highSet, lowSet) = self._getWeightSets()
+        if weight in highSet:
+            self.high.remove(weight)
+            highSet.discard(weight)
+        if weight in lowSet:
+            self.low.remove(weight)
+            lowSet.discard(weight)
+        return
+
     def Reset(self):
         self.nFound = 0
         return
@@ -94,8 +139,18 @@ class SystematicBase:
             raise TypeError("ERROR: can only merge samples for shapeSys")
         self.merged = True
         self.sampleList = sampleList
+        self._mergedName = None
         return
 
+    @property
+    def mergedName(self):
+        """
+        Name of the merged samples as used in histogram names; computed once per mergeSamples() call
+        """
+        if self._mergedName is None:
+            self._mergedName = "".join(self.sampleList)
+        return self._mergedName
+
     def foundSample(self):
         self.nFound += 1
         return
@@ -0,0 +1,622 @@
+import ROOT
+ROOT.gROOT.SetBatch(True)
+
+import pytest
+
+from xml.etree import ElementTree
+
+from scipy.stats import chi2
+
+# the thing we test
+import sample
+from configManager import configMgr
+from systematic import Systematic
+
+@pytest.fixture(autouse=True)
+def config():
+  # the sample methods read their histograms and pruning settings from the global configMgr;
+  # give every test its own histogram dictionary and put the settings back afterwards
+  saved = (configMgr.hists, configMgr.prun, configMgr.prunMethod, configMgr.prunThreshold)
+  configMgr.hists = {}
+  configMgr.prun = False
+  yield configMgr
+  (configMgr.hists, configMgr.prun, configMgr.prunMethod, configMgr.prunThreshold) = saved
+
+def make_hist(name, contents, errors=None, htype=ROOT.TH1D):
+  # contents and errors of the bins, without under- and overflow
+  h = htype(name, name, len(contents), 0, len(contents))
+  for (i, content) in enumerate(contents):
+    h.SetBinContent(i+1, content)
+    if errors is not None:
+      h.SetBinError(i+1, errors[i])
+  return h
+
+def assert_same(h, ref, rel=1e-9):
+  # compare all cells, including under- and overflow
+  assert h.GetNcells() == ref.GetNcells()
+  for i in range(ref.GetNcells()):
+    assert h.GetBinContent(i) == pytest.approx(ref.GetBinContent(i), rel=rel, abs=1e-12)
+    assert h.GetBinError(i) == pytest.approx(ref.GetBinError(i), rel=rel, abs=1e-12)
+
+# the helpers work on the buffers of double and float histograms, and bin by bin on integer ones;
+# float storage rounds every intermediate result of the ROOT calls
+histTypes = pytest.mark.parametrize("htype, rel", [(ROOT.TH1D, 1e-9), (ROOT.TH1F, 1e-6), (ROOT.TH1I, 1e-9)],
+                                    ids=["TH1D", "TH1F", "TH1I"])
+
+@histTypes
+def test_transferToNominal(htype, rel):
+  h = make_hist("transfer_h", [4., 9., 3., 0., 7.], [2., 3., 1., 0.5, 2.5], htype)
+  hNomSys = make_hist("transfer_nomSys", [2., 3., 0., 1., 5.], [1., 1., 0., 1., 2.], htype)
+  hNom = make_hist("transfer_nom", [3., 6., 2., 2., 4.], [1.5, 2., 1., 1., 1.], htype)
+
+  # what addHistoSys used to do
+  ref = h.Clone("transfer_ref")
+  assert ref.Divide(hNomSys)
+  ref.Multiply(hNom)
+
+  assert sample._transferToNominal(h, hNomSys, hNom)
+  assert_same(h, ref, rel)
+
+def test_transferToNominal_binning():
+  h = make_hist("transfer_bins_h", [1., 2., 3.])
+  hNomSys = make_hist("transfer_bins_nomSys", [1., 2.])
+  hNom = make_hist("transfer_bins_nom", [1., 2., 3.])
+  assert not sample._transferToNominal(h, hNomSys, hNom)
+
+@histTypes
+def test_symmetrizeOneSidedSystematic(htype, rel):
+  configMgr.hists["oneSide_nom"] = make_hist("oneSide_nom", [5., 2., 8., 1.], [1., 0.5, 2., 0.3], htype)
+  configMgr.hists["oneSide_high"] = make_hist("oneSide_high", [6., 5., 7., 1.], [1.2, 1., 1.5, 0.2], htype)
+
+  # what addHistoSys used to do
+  ref = configMgr.hists["oneSide_nom"].Clone("oneSide_ref")
+  ref.Scale(2.0)
+  ref.Add(configMgr.hists["oneSide_high"], -1.0)
+  for iBin in range(1, ref.GetNbinsX()+1):
+    if ref.GetBinContent(iBin) < 0.:
+      ref.SetBinContent(iBin, 0.)
+
+  sample.symmetrizeOneSidedSystematic("oneSide_nom", "oneSide_low", "oneSide_high")
+  assert_same(configMgr.hists["oneSide_low"], ref, rel)
+
+def envelope_reference(hNom, hLow, hHigh):
+  # the bin loop symmetrizeSystematicEnvelope() replaced
+  for iBin in range(1, hLow.GetNbinsX()+1):
+    nomVal = hNom.GetBinContent(iBin)
+    err = max(abs(nomVal-hLow.GetBinContent(iBin)), abs(hHigh.GetBinContent(iBin)-nomVal))
+    hHigh.SetBinContent(iBin, nomVal + err)
+    hLow.SetBinContent(iBin, max(nomVal - err, 0.))
+
+@histTypes
+def test_symmetrizeSystematicEnvelope(htype, rel):
+  # the last nominal bin is negative, where the low bin is truncated to 0
+  hNom = make_hist("envelope_nom", [5., 2., 8., -1.], htype=htype)
+  hLow = make_hist("envelope_low", [4., 1.5, 9., -0.5], htype=htype)
+  hHigh = make_hist("envelope_high", [7., 2.2, 8.5, -1.2], htype=htype)
+  configMgr.hists.update({"envelope_nom": hNom, "envelope_low": hLow, "envelope_high": hHigh})
+
+  refLow = hLow.Clone("envelope_refLow")
+  refHigh = hHigh.Clone("envelope_refHigh")
+  envelope_reference(hNom, refLow, refHigh)
+
+  sample.symmetrizeSystematicEnvelope("envelope_nom", "envelope_low", "envelope_high")
+  assert_same(hLow, refLow, rel)
+  assert_same(hHigh, refHigh, rel)
+
+  # several fit configurations can symmetrize the same histograms; like the bin loop, every call
+  # builds the envelope again, which widens it where the nominal is negative
+  envelope_reference(hNom, refLow, refHigh)
+  sample.symmetrizeSystematicEnvelope("envelope_nom", "envelope_low", "envelope_high")
+  assert_same(hLow, refLow, rel)
+  assert_same(hHigh, refHigh, rel)
+
+  hNom.Scale(2.0)
+  envelope_reference(hNom, refLow, refHigh)
+  sample.symmetrizeSystematicEnvelope("envelope_nom", "envelope_low", "envelope_high")
+  assert_same(hLow, refLow, rel)
+  assert_same(hHigh, refHigh, rel)
+
+def chi2test_reference(h1, h2):
+  # the bin loop chi2test() replaced
+  if h2.Integral() == 0:
+    return 1
+  norm = h1.Integral() / h2.Integral()
+
+  binsX = range(1, h1.GetNbinsX()+1)
+  binsY = range(1, h1.GetNbinsY()+1) if h1.InheritsFrom("TH2") else [0]
+
+  test_chi2, dof = 0, 0
+  for i in binsX:
+    for j in binsY:
+      idx = h1.GetBin(i, j)
+      if(h1.GetBinContent(idx) * h1.GetBinContent(idx) == 0 and h2.GetBinContent(idx) * h2.GetBinContent(idx)):
+        continue
+      sigma = max([h1.GetBinError(idx), h2.GetBinError(idx)*norm])
+      if sigma == 0: continue
+      test_chi2 += ((h1.GetBinContent(idx) - h2.GetBinContent(idx)*norm) / sigma)**2
+      dof += 1
+
+  return chi2.sf(test_chi2, dof)
+
+def test_chi2test():
+  # the third bin is empty in h1 only, the fourth bin has no error in either histogram
+  h1 = make_hist("chi2test_h1", [10., 20., 0., 0., 8.], [3., 4., 0., 0., 3.])
+  h2 = make_hist("chi2test_h2", [12., 17., 4., 0., 5.], [3.5, 4., 2., 0., 2.])
+  h1.SetBinContent(0, 50.)
+  h2.SetBinContent(6, 50.)
+  assert sample.chi2test(h1, h2) == pytest.approx(chi2test_reference(h1, h2), rel=1e-9)
+  assert sample.chi2test(h2, h1) == pytest.approx(chi2test_reference(h2, h1), rel=1e-9)
+
+def test_chi2test_2d():
+  h1 = ROOT.TH2D("chi2test_2d_h1", "chi2test_2d_h1", 3, 0, 3, 2, 0, 2)
+  h2 = ROOT.TH2D("chi2test_2d_h2", "chi2test_2d_h2", 3, 0, 3, 2, 0, 2)
+  for (x, y, w1, w2) in [(0.5, 0.5, 10., 12.), (1.5, 0.5, 4., 3.), (2.5, 1.5, 7., 9.), (0.5, 1.5, 0., 2.)]:
+    if w1:
+      h1.Fill(x, y, w1)
+    h2.Fill(x, y, w2)
+  assert sample.chi2test(h1, h2) == pytest.approx(chi2test_reference(h1, h2), rel=1e-9)
+
+def test_chi2test_empty():
+  h1 = make_hist("chi2test_empty_h1", [1., 2.])
+  h2 = make_hist("chi2test_empty_h2", [0., 0.])
+  assert sample.chi2test(h1, h2) == 1
+
+def test_chi2TestWW():
+  # the third bin is empty in both histograms
+  h1 = make_hist("chi2_h1", [10., 20., 0., 15., 8.], [3., 4., 0., 4., 3.])
+  h2 = make_hist("chi2_h2", [12., 17., 0., 16., 5.], [3.5, 4., 0., 4., 2.])
+
+  pvalue = sample._chi2TestWW(*sample._comparisonArrays(h1, False), *sample._comparisonArrays(h2, False))
+  assert pvalue == pytest.approx(h1.Chi2Test(h2, "WW"), rel=1e-6)
+
+  pvalue = sample._chi2TestWW(*sample._comparisonArrays(h1, True), *sample._comparisonArrays(h2, True))
+  assert pvalue == pytest.approx(h1.Chi2Test(h2, "WW UF OF"), rel=1e-6)
+
+def test_chi2TestWW_binning():
+  h1 = make_hist("chi2_bins_h1", [10., 20., 15.])
+  h2 = make_hist("chi2_bins_h2", [10., 20.])
+  with pytest.raises(ValueError):
+    sample._chi2TestWW(*sample._comparisonArrays(h1, False), *sample._comparisonArrays(h2, False))
+
+@pytest.mark.parametrize("high, low, expected", [
+  (1.0, 1.0, None),
+  (0.0, 0.0, None),
+  (1.2, 1.2, (1.2, 0.8)),
+  (1.0, 0.9, (1.1, 0.9)),
+  (1.1, 1.0, (1.1, 0.9)),
+  (1.5, 0.001, (1.5, 0.01)),
+  (1.1, 0.8, (1.1, 0.8)),
+])
+def test_sanitizeOverallSys(high, low, expected):
+  result = sample._sanitizeOverallSys("syst", high, low)
+  if expected is None:
+    assert result is None
+  else:
+    assert result == pytest.approx(expected)
+
+def test_addHistoSys_normalizedShapeOnly():
+  configMgr.hists["hCase1Nom"] = make_hist("hCase1Nom", [10., 20., 30.], [1., 2., 3.])
+  configMgr.hists["hCase1High"] = make_hist("hCase1High", [12., 23., 31.], [1., 2., 3.])
+  configMgr.hists["hCase1Low"] = make_hist("hCase1Low", [9., 18., 28.], [1., 2., 3.])
+  # the histograms summed over the normalization regions
+  configMgr.hists["hcase1Nom_Norm"] = make_hist("hcase1Nom_Norm", [100.])
+  configMgr.hists["hcase1case1SystHigh_Norm"] = make_hist("hcase1case1SystHigh_Norm", [110.])
+  configMgr.hists["hcase1case1SystLow_Norm"] = make_hist("hcase1case1SystLow_Norm", [80.])
+
+  s = sample.Sample("case1")
+  s.setNormRegions([("CR", "cuts")])
+  s.addHistoSys("case1Syst", "hCase1Nom", "hCase1High", "hCase1Low", includeOverallSys=False, normalizeSys=True, samName="case1")
+
+  # the variations are normalized to the nominal in the normalization regions, without an overallSys
+  assert s.getHistoSys("case1Syst")[:3] == ("case1Syst", "hCase1HighNorm", "hCase1LowNorm")
+  assert s.getOverallSys("case1Syst") is None
+  refHigh = configMgr.hists["hCase1High"].Clone("case1_refHigh")
+  refHigh.Scale(100./110.)
+  refLow = configMgr.hists["hCase1Low"].Clone("case1_refLow")
+  refLow.Scale(100./80.)
+  assert_same(configMgr.hists["hCase1HighNorm"], refHigh)
+  assert_same(configMgr.hists["hCase1LowNorm"], refLow)
+
+def test_addHistoSys_noRenormSys():
+  # without normalization regions, normalizeSys is ignored and the variations are used as they are
+  configMgr.hists["hCase1bNom"] = make_hist("hCase1bNom", [10., 20., 30.])
+  configMgr.hists["hCase1bHigh"] = make_hist("hCase1bHigh", [12., 23., 31.])
+  configMgr.hists["hCase1bLow"] = make_hist("hCase1bLow", [9., 18., 28.])
+
+  s = sample.Sample("case1b")
+  s.addHistoSys("case1bSyst", "hCase1bNom", "hCase1bHigh", "hCase1bLow", includeOverallSys=False, normalizeSys=True)
+
+  assert s.getHistoSys("case1bSyst")[:3] == ("case1bSyst", "hCase1bHigh", "hCase1bLow")
+  assert s.getOverallSys("case1bSyst") is None
+  assert "hCase1bHighNorm" not in configMgr.hists
+
+def test_addHistoSys_overallSys():
+  configMgr.hists["hCase2Nom"] = make_hist("hCase2Nom", [10., 20., 30.], [1., 2., 3.])
+  configMgr.hists["hCase2High"] = make_hist("hCase2High", [12., 23., 31.], [1., 2., 3.])
+  configMgr.hists["hCase2Low"] = make_hist("hCase2Low", [9., 18., 28.], [1., 2., 3.])
+
+  s = sample.Sample("case2")
+  s.addHistoSys("case2Syst", "hCase2Nom", "hCase2High", "hCase2Low", includeOverallSys=True, normalizeSys=False)
+
+  nom = configMgr.hists["hCase2Nom"].Integral()
+  high = configMgr.hists["hCase2High"].Integral() / nom
+  low = configMgr.hists["hCase2Low"].Integral() / nom
+  (name, overallHigh, overallLow) = s.getOverallSys("case2Syst")
+  assert name == "case2Syst"
+  assert (overallHigh, overallLow) == pytest.approx((high, low))
+
+  # the shape part are the variations scaled to the nominal integral
+  assert s.getHistoSys("case2Syst")[:3] == ("case2Syst", "hCase2HighNorm", "hCase2LowNorm")
+  refHigh = configMgr.hists["hCase2High"].Clone("case2_refHigh")
+  refHigh.Scale(1./high)
+  refLow = configMgr.hists["hCase2Low"].Clone("case2_refLow")
+  refLow.Scale(1./low)
+  assert_same(configMgr.hists["hCase2HighNorm"], refHigh)
+  assert_same(configMgr.hists["hCase2LowNorm"], refLow)
+
+def test_addHistoSys_shapeOnly():
+  configMgr.hists["hCase3Nom"] = make_hist("hCase3Nom", [10., 20., 30.])
+  configMgr.hists["hCase3High"] = make_hist("hCase3High", [12., 23., 31.])
+  configMgr.hists["hCase3Low"] = make_hist("hCase3Low", [9., 18., 28.])
+
+  s = sample.Sample("case3")
+  s.addHistoSys("case3Syst", "hCase3Nom", "hCase3High", "hCase3Low", includeOverallSys=False, normalizeSys=False)
+
+  assert s.getHistoSys("case3Syst")[:3] == ("case3Syst", "hCase3High", "hCase3Low")
+  assert s.getOverallSys("case3Syst") is None
+
+def test_getHistoSys_listChanged():
+  # getHistoSys() has to agree with a scan of histoSystList, also when the list was changed directly
+  s = sample.Sample("lookup")
+  for name in ["a", "b", "c"]:
+    s.histoSystList.append((name, name+"High", name+"Low", "", "", "", "", ""))
+  assert s.getHistoSys("a")[1] == "aHigh"
+  assert s.getHistoSys("b")[1] == "bHigh"
+
+  # same length as before, with an entry removed and a new one appended
+  del s.histoSystList[0]
+  s.histoSystList.append(("d", "dHigh", "dLow", "", "", "", "", ""))
+  assert s.getHistoSys("d")[1] == "dHigh"
+  assert s.getHistoSys("a") is None
+  assert s.getHistoSys("b")[1] == "bHigh"
+
+  # replaced in place by a different systematic
+  s.histoSystList[1] = ("e", "eHigh", "eLow", "", "", "", "", "")
+  assert s.getHistoSys("e")[1] == "eHigh"
+  assert s.getHistoSys("c") is None
+
+  # replaced through the sample; the first entry of a name is the one replaced
+  s.histoSystList.append(("b", "bHigh2", "bLow2", "", "", "", "", ""))
+  s.replaceHistoSys(("b", "bHigh3", "bLow3", "", "", "", "", ""))
+  assert [syst[1] for syst in s.histoSystList] == ["bHigh3", "eHigh", "dHigh", "bHigh2"]
+  assert s.getHistoSys("b")[1] == "bHigh3"
+
+def test_getOverallSys_listChanged():
+  # the overallSys lookups have to agree with a scan of overallSystList, also when the list was changed directly
+  s = sample.Sample("overall")
+  s.addOverallSys("a", 1.1, 0.9)
+  s.addOverallSys("b", 1.2, 0.8)
+  assert s.getOverallSys("a") == ("a", 1.1, 0.9)
+
+  # appended, reassigned and removed on the list itself
+  s.overallSystList.append(("c", 1.3, 0.7))
+  assert s.getOverallSys("c") == ("c", 1.3, 0.7)
+  s.overallSystList[0] = ("d", 1.4, 0.6)
+  assert s.getOverallSys("d") == ("d", 1.4, 0.6)
+  assert s.getOverallSys("a") is None
+  del s.overallSystList[0]
+  assert s.getOverallSys("d") is None
+  assert s.getOverallSys("b") == ("b", 1.2, 0.8)
+
+  # replacing or removing an entry that was changed on the list
+  s.overallSystList[0] = ("b", 1.25, 0.75)
+  s.replaceOverallSys(("b", 1.05, 0.95))
+  assert s.overallSystList == [("b", 1.05, 0.95), ("c", 1.3, 0.7)]
+
+  # of several entries of a name, the first one is removed; removeOverallSys() also drops the systematic itself
+  s.addOverallSys("c", 1.5, 0.5)
+  s.systDict["c"] = None
+  s.removeOverallSys("c")
+  assert s.overallSystList == [("b", 1.05, 0.95), ("c", 1.5, 0.5)]
+  assert s.getOverallSys("c") == ("c", 1.5, 0.5)
+  assert "c" not in s.systDict
+
+def shapeSys_reference(hNom, hHigh, hLow, suffix):
+  # the bin loops addShapeSys() replaced, on copies of the histograms
+  hHighNorm = hHigh.Clone(hHigh.GetName()+suffix)
+  hLowNorm = hLow.Clone(hLow.GetName()+suffix)
+  hNomNorm = hNom.Clone(hNom.GetName()+suffix)
+  for h in [hHighNorm, hLowNorm]:
+    for iBin in range(h.GetNbinsX()+1):
+      try:
+        h.SetBinContent(iBin, abs((h.GetBinContent(iBin) / hNom.GetBinContent(iBin)) - 1.0))
+      except ZeroDivisionError:
+        h.SetBinContent(iBin, 0.)
+      h.SetBinError(iBin, 0.)
+  for iBin in range(hNomNorm.GetNbinsX()+1):
+    hNomNorm.SetBinContent(iBin, max(hHighNorm.GetBinContent(iBin), hLowNorm.GetBinContent(iBin)))
+    hNomNorm.SetBinError(iBin, 0.)
+  return (hNomNorm, hHighNorm, hLowNorm)
+
+@histTypes
+def test_addShapeSys(htype, rel):
+  # the second bin has an empty nominal, the underflow and overflow are filled as well
+  hNom = make_hist("shapeSys_nom", [10., 0., 30., 5.], [1., 0., 3., 1.], htype)
+  hHigh = make_hist("shapeSys_high", [12., 2., 27., 9.], [1., 1., 3., 1.], htype)
+  hLow = make_hist("shapeSys_low", [7., 1., 33., 4.], [1., 1., 3., 1.], htype)
+  for (h, under, over) in [(hNom, 4., 6.), (hHigh, 5., 9.), (hLow, 2., 3.)]:
+    h.SetBinContent(0, under)
+    h.SetBinContent(5, over)
+  configMgr.hists.update({"shapeSys_nom": hNom, "shapeSys_high": hHigh, "shapeSys_low": hLow})
+
+  # integer histograms truncate the relative deviations, as the bin loops did
+  (refNom, refHigh, refLow) = shapeSys_reference(hNom, hHigh, hLow, "_ref")
+
+  s = sample.Sample("shapeSys")
+  s.addShapeSys("shapeSysSyst", "shapeSys_nom", "shapeSys_high", "shapeSys_low")
+  assert_same(configMgr.hists["shapeSys_nomNorm"], refNom, rel)
+  assert_same(configMgr.hists["shapeSys_highNorm"], refHigh, rel)
+  assert_same(configMgr.hists["shapeSys_lowNorm"], refLow, rel)
+  assert s.systList == ["shapeSysSyst"]
+
+def shapeStat_reference(hNom, statErrorThreshold=None):
+  # the bin loop addShapeStat() replaced, on a copy of the histogram
+  hNorm = hNom.Clone(hNom.GetName()+"_ref")
+  for iBin in range(hNorm.GetNbinsX()+1):
+    try:
+      ratio = hNom.GetBinError(iBin) / hNom.GetBinContent(iBin)
+      if (statErrorThreshold is not None) and (ratio<statErrorThreshold):
+        ratio = 0.0
+      hNorm.SetBinContent(iBin, ratio)
+      hNorm.SetBinError(iBin, 0.)
+    except ZeroDivisionError:
+      hNorm.SetBinContent(iBin, 0.)
+      hNorm.SetBinError(iBin, 0.)
+  return hNorm
+
+@histTypes
+def test_addShapeStat(htype, rel):
+  # an empty and a negative bin, with the underflow and overflow filled
+  hNom = make_hist("shapeStat_nom", [10., 0., -4., 25.], [2., 1., 1., 10.], htype)
+  hNom.SetBinContent(0, 8.)
+  hNom.SetBinError(0, 4.)
+  hNom.SetBinContent(5, 3.)
+  configMgr.hists["shapeStat_nom"] = hNom
+  ref = shapeStat_reference(hNom)
+
+  s = sample.Sample("shapeStat")
+  s.addShapeStat("shapeStatSyst", "shapeStat_nom")
+  assert_same(configMgr.hists["shapeStat_nomNorm"], ref, rel)
+  assert s.systList == ["shapeStatSyst"]
+
+@histTypes
+def test_addShapeStat_threshold(htype, rel, monkeypatch):
+  # relative errors 0.2, empty, 0.05, 0.4 and 0.01 in the underflow
+  hNom = make_hist("shapeStatThr_nom", [10., 0., 20., 25.], [2., 1., 1., 10.], htype)
+  hNom.SetBinContent(0, 100.)
+  hNom.SetBinError(0, 1.)
+  configMgr.hists["shapeStatThr_nom"] = hNom
+  ref = shapeStat_reference(hNom, statErrorThreshold=0.1)
+
+  messages = []
+  monkeypatch.setattr(sample.log, "info", messages.append)
+  s = sample.Sample("shapeStatThr")
+  s.addShapeStat("shapeStatThrSyst", "shapeStatThr_nom", statErrorThreshold=0.1)
+  assert_same(configMgr.hists["shapeStatThr_nomNorm"], ref, rel)
+
+  # one message for the whole systematic, the empty bin is not reported
+  assert len(messages) == 1
+  assert "2/5 bin(s) [0, 3]" in messages[0]
+
+def test_addHistoSys_normalizedOverallSys():
+  configMgr.hists["hCase1oNom"] = make_hist("hCase1oNom", [10., 20., 30.], [1., 2., 3.])
+  configMgr.hists["hCase1oHigh"] = make_hist("hCase1oHigh", [12., 23., 31.], [1., 2., 3.])
+  configMgr.hists["hCase1oLow"] = make_hist("hCase1oLow", [9., 18., 28.], [1., 2., 3.])
+  configMgr.hists["hcase1oNom_Norm"] = make_hist("hcase1oNom_Norm", [100.])
+  configMgr.hists["hcase1ocase1oSystHigh_Norm"] = make_hist("hcase1ocase1oSystHigh_Norm", [120.])
+  configMgr.hists["hcase1ocase1oSystLow_Norm"] = make_hist("hcase1ocase1oSystLow_Norm", [80.])
+
+  # the two scalings of the old implementation: to the normalization regions, then to the nominal
+  hNom = configMgr.hists["hCase1oNom"]
+  refs = []
+  for (name, remapIntegral) in [("hCase1oHigh", 120.), ("hCase1oLow", 80.)]:
+    ref = configMgr.hists[name].Clone(name+"_ref")
+    ref.Scale(1./(remapIntegral/100.))
+    ratio = ref.Integral() / hNom.Integral()
+    ref.Scale(1./ratio)
+    refs.append((ref, ratio))
+
+  s = sample.Sample("case1o")
+  s.setNormRegions([("CR", "cuts")])
+  s.addHistoSys("case1oSyst", "hCase1oNom", "hCase1oHigh", "hCase1oLow", includeOverallSys=True, normalizeSys=True, samName="case1o")
+
+  assert s.getHistoSys("case1oSyst")[:3] == ("case1oSyst", "hCase1oHighNorm", "hCase1oLowNorm")
+  assert_same(configMgr.hists["hCase1oHighNorm"], refs[0][0])
+  assert_same(configMgr.hists["hCase1oLowNorm"], refs[1][0])
+  (name, overallHigh, overallLow) = s.getOverallSys("case1oSyst")
+  assert overallHigh == pytest.approx(refs[0][1], rel=1e-12)
+  assert overallLow == pytest.approx(refs[1][1], rel=1e-12)
+
+@histTypes
+def test_scaledClone(htype, rel):
+  h = make_hist("scaledClone_in", [10., 0., -3., 25.], [2., 1., 1., 4.], htype)
+  h.SetBinContent(0, 6.)
+  h.SetBinContent(5, 8.)
+  hNoSumw2 = make_hist("scaledClone_noSumw2", [10., 4., 3., 25.], htype=htype)
+  hNoSumw2.Sumw2(False)
+
+  for hist in [h, hNoSumw2]:
+    for factor in [2.5, 1.0, -0.5]:
+      ref = hist.Clone(hist.GetName()+"_ref")
+      ref.Scale(factor)
+      clone = sample._scaledClone(hist, hist.GetName()+"_out", factor)
+      assert clone.GetName() == hist.GetName()+"_out"
+      assert_same(clone, ref, rel)
+
+def buildHisto_reference(name, values, binLow, binWidth):
+  # the bin loop buildHisto() replaced
+  h = ROOT.TH1F(name, name, len(values), binLow, float(len(values))*binWidth+binLow)
+  for (iBin, value) in enumerate(values):
+    if value <= 0:
+      value = configMgr.minValue
+    h.SetBinContent(iBin+1, value)
+  return h
+
+@pytest.mark.parametrize("isData, histoName", [(False, "hbuildNom_SR_obs_cuts"), (True, "hbuild_SR_obs_cuts")], ids=["mc", "data"])
+def test_buildHisto(isData, histoName):
+  values = [3.5, 0., 12., -1., 7.25]
+  s = sample.Sample("build")
+  s.setData(isData)
+  s.buildHisto(values, "SR", "cuts", binLow=2., binWidth=0.5)
+
+  assert s.histoName == histoName
+  h = configMgr.hists[histoName]
+  ref = buildHisto_reference("build_ref", values, 2., 0.5)
+  assert h.GetNbinsX() == ref.GetNbinsX()
+  assert h.GetXaxis().GetXmin() == ref.GetXaxis().GetXmin()
+  assert h.GetXaxis().GetXmax() == ref.GetXaxis().GetXmax()
+  assert_same(h, ref, rel=1e-6)
+  assert h.Integral() == pytest.approx(ref.Integral(), rel=1e-6)
+
+  errors = [0.5, 0.1, 2., 0.1, 1.5]
+  s.buildStatErrors(errors, "SR", "cuts")
+  for (iBin, error) in enumerate(errors):
+    ref.SetBinError(iBin+1, error)
+  assert_same(h, ref, rel=1e-6)
+
+def test_buildStatErrors_mismatch():
+  s = sample.Sample("buildMismatch")
+  s.buildHisto([1., 2., 3.], "SR", "cuts")
+  with pytest.raises(Exception, match="does not match"):
+    s.buildStatErrors([0.1, 0.2], "SR", "cuts")
+
+  # the errors need the histogram
+  del configMgr.hists[s.histoName]
+  with pytest.raises(Exception, match="without building histogram"):
+    s.buildStatErrors([0.1, 0.2, 0.3], "SR", "cuts")
+
+def test_Clone_currentSystematic():
+  s = sample.Sample("cloneSyst")
+  s.addSystematic(Systematic("jes", "", "_JESup", "_JESdown", "tree", "histoSys"))
+  s.addSystematic(Systematic("wsys", ["w"], ["w", "wUp"], ["w", "wDown"], "weight", "histoSys"))
+
+  # a tree systematic selects the tree name suffix of the clone
+  s.setCurrentSystematic("jes", "high")
+  c = s.Clone()
+  assert c.currentSystematic == "_JESup"
+  assert c.getTreenameSuffix() == "_JESup"
+  assert c.systDict["jes"] is not s.systDict["jes"]
+
+  # a weight systematic points at the weight list of the clone's own systematic
+  s.setCurrentSystematic("wsys", "low")
+  c = s.Clone()
+  assert c.currentSystematic is c.systDict["wsys"].low
+  assert c.currentSystematic is not s.currentSystematic
+  c.systDict["wsys"].low.append("wExtra")
+  assert c.currentSystematic == ["w", "wDown", "wExtra"]
+  assert s.currentSystematic == ["w", "wDown"]
+
+  # without a current systematic the clone has none either
+  s.removeCurrentSystematic()
+  assert s.Clone().currentSystematic is None
+
+def sampleString_reference(s):
+  # the string concatenation __str__() used before it was cached
+  ref = "  <Sample Name=\"%s\" HistoName=\"%s\" InputFile=\"%s\" NormalizeByTheory=\"%s\">\n" % (s.name, s.histoName, configMgr.histCacheFile, s.normByTheory)
+  if s.statConfig:
+    ref += "    <StatError Activate=\"%s\"/>\n" % s.statConfig
+  for histoSyst in s.histoSystList:
+    ref += f"    <HistoSys Name=\"{histoSyst[0]}\" HistoNameHigh=\"{histoSyst[1]}\" HistoNameLow=\"{histoSyst[2]}\" />\n"
+  for shapeSyst in s.shapeSystList:
+    ref += f"    <ShapeSys Name=\"{shapeSyst[0]}\" HistoName=\"{shapeSyst[1]}\" ConstraintType=\"{shapeSyst[2]}\"/>\n"
+  for overallSyst in s.overallSystList:
+    ref += f"    <OverallSys Name=\"{overallSyst[0]}\" High=\"{float(overallSyst[1]):g}\" Low=\"{float(overallSyst[2]):g}\" />\n"
+  for shapeFact in s.shapeFactorList:
+    ref += "    <ShapeFactor Name=\"%s\" />\n" % shapeFact
+  for normFactor in s.normFactor:
+    ref += f"    <NormFactor Name=\"{normFactor[0]}\" Val=\"{normFactor[1]:g}\" High=\"{normFactor[2]:g}\" Low=\"{normFactor[3]:g}\" Const=\"{normFactor[4]}\" />\n"
+  ref += "  </Sample>\n\n"
+  return ref
+
+def test_str_changes(monkeypatch):
+  monkeypatch.setattr(configMgr, "histCacheFile", "data/cache.root")
+  s = sample.Sample("strCache")
+  s.setHistoName("hstrCacheNom")
+  s.setStatConfig(True)
+  s.addOverallSys("ovSyst", 1.1, 0.9)
+  s.histoSystList.append(("hSyst", "hHigh", "hLow", configMgr.histCacheFile, "", "", "", ""))
+
+  first = str(s)
+  assert first == sampleString_reference(s)
+  assert str(s) == first
+
+  # each change is picked up, whether it goes through the Sample methods or not
+  changes = [
+    lambda: s.addOverallSys("ovSyst2", 1.2, 0.7),
+    lambda: s.replaceOverallSys(("ovSyst2", 1.25, 0.75)),
+    lambda: s.shapeSystList.append(("shSyst", "hstrCacheNomNorm", "Gaussian", "", "", "", "")),
+    lambda: s.histoSystList.__setitem__(0, ("hSyst", "hHigh2", "hLow2", configMgr.histCacheFile, "", "", "", "")),
+    lambda: s.overallSystList.__setitem__(0, ("ovSyst", 1.3, 0.8)),
+    lambda: s.addShapeFactor("shFact"),
+    lambda: s.setNormFactor("mu", 1., 0., 10.),
+    lambda: s.normFactor.append(("mu2", 1., 0., 5., True)),
+    lambda: s.setNormByTheory(not s.normByTheory),
+    lambda: s.setHistoName("hstrCacheNom2"),
+    lambda: monkeypatch.setattr(configMgr, "histCacheFile", "data/other.root"),
+  ]
+  previous = first
+  for change in changes:
+    change()
+    current = str(s)
+    assert current != previous
+    assert current == sampleString_reference(s)
+    previous = current
+
+def test_str_escaping(monkeypatch):
+  monkeypatch.setattr(configMgr, "histCacheFile", "data/a&b.root")
+  s = sample.Sample("tt<bar>")
+  s.setHistoName("htt\"Nom\"")
+  s.setNormByTheory(True)
+  s.addOverallSys("jes&jer", 1.1, 0.9)
+  s.histoSystList.append(("shape<1>", "hHigh&", "hLow\"", configMgr.histCacheFile, "", "", "", ""))
+  s.addShapeFactor("sf<1>")
+
+  assert str(s) == (
+    "  <Sample Name=\"tt&lt;bar&gt;\" HistoName=\"htt&quot;Nom&quot;\" InputFile=\"data/a&amp;b.root\" NormalizeByTheory=\"True\">\n"
+    "    <HistoSys Name=\"shape&lt;1&gt;\" HistoNameHigh=\"hHigh&amp;\" HistoNameLow=\"hLow&quot;\" />\n"
+    "    <OverallSys Name=\"jes&amp;jer\" High=\"1.1\" Low=\"0.9\" />\n"
+    "    <ShapeFactor Name=\"sf&lt;1&gt;\" />\n"
+    "  </Sample>\n\n")
+
+  # the names read back unchanged from the XML
+  element = ElementTree.fromstring(str(s))
+  assert element.get("Name") == "tt<bar>"
+  assert element.get("HistoName") == "htt\"Nom\""
+  assert element.get("InputFile") == "data/a&b.root"
+  assert [(e.tag, e.get("Name")) for e in element] == [("HistoSys", "shape<1>"), ("OverallSys", "jes&jer"), ("ShapeFactor", "sf<1>")]
+  assert element.find("HistoSys").get("HistoNameLow") == "hLow\""
+
+def test_addInput():
+  s = sample.Sample("inputs")
+  s.addInput("a.root", friends=[("f.root", "friendTree")])
+  first = next(iter(s.input_files))
+  s.addInput("a.root")
+  s.addInput("a.root", "inputs")
+
+  # the same file and tree are kept once, with the friends of the first call
+  assert len(s.input_files) == 1
+  assert next(iter(s.input_files)) is first
+  assert [f.filename for f in first.friends] == ["f.root"]
+
+  s.addInput("a.root", "otherTree")
+  s.addInputs(["a.root", "b.root"])
+  assert sorted((i.filename, i.treename) for i in s.input_files) == [("a.root", "inputs"), ("a.root", "otherTree"), ("b.root", "inputs")]
+
+  # the override tree name applies to later calls, and clones keep adding on their own
+  s.setOverrideTreename("overridden")
+  c = s.Clone()
+  c.addInput("a.root")
+  c.addInput("a.root")
+  assert ("a.root", "overridden") in [(i.filename, i.treename) for i in c.input_files]
+  assert len(c.input_files) == 4
+  assert len(s.input_files) == 3